@@ -8,31 +8,85 @@
 # Designed to work with a neural network that outputs (policy, value)
 # The key workflow: Predict → Expand root → Simulate → Backpropagate → Return move probabilities
 
+import time
+
 import numpy as np
-import torch
 
-from board import state_to_board, is_king_captured, make_move
-from moves import get_all_moves, move_to_action_index, action_index_to_move
-from mcts import MCTSNode
+from board import Position, state_to_position, is_king_captured
+from cache import LEGAL_MOVES_KEY
+from evaluators import Evaluator, LogitsEvaluator, TorchEvaluator
+from moves import get_all_actions, get_legal_actions, move_to_action_index, action_index_to_move
+from mcts import MCTSTree
+from profiling import SearchStats
 
 # Simple AlphaZero MCTS implementation
 class AlphaZero:
-    def __init__(self, model, num_simulations=100):
+    def __init__(self, model, num_simulations=100, batch_size=1, virtual_loss=1.0, cache=None, collect_stats=False,
+                 time_limit=None, node_limit=None, early_stop=False, dirichlet_alpha=None, noise_fraction=0.25,
+                 legal_moves=False):
         """
         Initialize the AlphaZero agent.
 
         Args:
             model: A PyTorch model that outputs (policy_logits, value) given a state
-            num_simulations: Number of MCTS simulations to perform for each move
+                (an eager AZNet or an aznet.build_inference_model build, with an 8100-way or compact policy head),
+                or any evaluators.Evaluator (ONNX Runtime, fake, ...)
+            num_simulations: Number of MCTS simulations to perform for each move (None for no simulation limit)
+            batch_size: Number of leaves collected per round and evaluated in one forward pass (K)
+            virtual_loss: Loss temporarily added to pending paths so the K leaves of a round diverge
+            cache: Optional EvaluationCache (cache.py) reused across searches, keyed by position Zobrist key
+                (and move generator, see cache.LEGAL_MOVES_KEY)
+            collect_stats: Record per-phase timers and counters of every search in last_stats (profiling.py)
+            time_limit: Optional wall-clock budget of a search in seconds
+            node_limit: Optional budget of tree nodes created by a search (a simulation that creates no node, e.g. one
+                ending in a terminal position, counts as one)
+            early_stop: Stop as soon as the most visited root move can no longer be overtaken within the budget
+            dirichlet_alpha: Optional Dirichlet noise concentration mixed into the priors of a freshly expanded root
+            noise_fraction: Weight of the noise in the root priors
+            legal_moves: Search fully legal moves only (a side without moves loses) instead of pseudo-legal ones
         """
         # The NN used for policy and value prediction
         self.model = model       
-        # How many simulations to run per move
+        # The search asks the evaluator for the priors and values of its leaves, a PyTorch model is wrapped in one
+        self.evaluator = model if isinstance(model, Evaluator) else TorchEvaluator(model)
+        # Search budget per move: the search ends at whichever of the limits is reached first
+        # (all three are plain attributes and may be changed between searches, e.g. by a game clock)
         self.num_simulations = num_simulations    
+        self.time_limit = time_limit
+        self.node_limit = node_limit
+        self.early_stop = early_stop
+        # Exploration noise at the root (AlphaZero-style), drawn from np.random so it follows np.random.seed()
+        # Off by default; independent searches of the same position only differ through it (see parallel_search.py)
+        self.dirichlet_alpha = dirichlet_alpha
+        self.noise_fraction = noise_fraction
+        # Move generator of the search and the value of a position without moves (see get_move_probabilities)
+        self.legal_moves = legal_moves
+        self.generate_actions = get_legal_actions if legal_moves else get_all_actions
+        self.no_moves_value = -1.0 if legal_moves else 0.0
+        # Cached priors follow the move generator, so legal and pseudo-legal agents use different cache keys
+        self.cache_key_mask = LEGAL_MOVES_KEY if legal_moves else 0
+        if num_simulations is None and time_limit is None and node_limit is None:
+            raise ValueError("AlphaZero needs at least one of num_simulations, time_limit and node_limit")
+        if num_simulations is not None and num_simulations < 1:
+            raise ValueError(f"num_simulations must be at least 1, got {num_simulations}")
+        # How many leaves to evaluate together, 1 gives the classic one-leaf-at-a-time search
+        self.batch_size = batch_size
+        self.virtual_loss = virtual_loss
+        # Evaluation cache in front of the network, may be shared with other agents of the same game
+        self.cache = cache
+        # Search tree of the most recent search, re-rooted by update_with_move() so it can be reused on the next move
+        # (tree.to_node() gives MCTSNode objects for analysis); root_position is the position at its root
+        self.tree = None
+        self.root_position = None
+        # SearchStats of the most recent search when collect_stats is on, None otherwise
+        self.collect_stats = collect_stats
+        self.last_stats = None
 
 # The predict() function is the entry point for the game environment to the neural network
 # Accepting as input a current game state represented as a NumPy tensor with shape (15, 10, 9),
-# it prepares the input to the model by converting it to a PyTorch tensor and adding a batch dimension (because most neural networks expect input with shape [batch_size, channels, height, width])
+# it runs the state through the evaluator as a batch of one and turns the policy logits into a distribution over all actions
+# Only network evaluators (evaluators.LogitsEvaluator, which includes the default TorchEvaluator) produce logits for
+# every action; other evaluators (e.g. FakeEvaluator) only give priors of the legal moves and raise a TypeError here
 
     def predict(self, state):
         """
@@ -42,43 +96,98 @@ class AlphaZero:
             state: The current game state (15x10x9 tensor as a NumPy array).
 
         Returns:
-            policy: A probability distribution over all 8100 possible actions.
+            policy: A probability distribution over all 8100 possible actions
+                (over moves.compact_actions for a compact policy head).
             value_scalar: A scalar value estimate for the current state.
+
+        Raises:
+            TypeError: If the evaluator does not produce policy logits (not an evaluators.LogitsEvaluator).
         """
         # Get policy and value from the neural network
-        state_tensor = torch.FloatTensor(state).unsqueeze(0)
-        with torch.no_grad():
-            policy_logits, value = self.model(state_tensor)
+        policy_logits, values = self.predict_batch([np.asarray(state, dtype=np.float32)])
         
-        policy = torch.softmax(policy_logits, dim=1).squeeze().numpy()
-        value_scalar = value.item()
+        policy = np.exp(policy_logits[0] - policy_logits[0].max())
+        policy = policy / np.sum(policy)
+        value_scalar = float(values[0])
         
         return policy, value_scalar
+
+# predict_batch() is the batched version of predict()
+# It evaluates K states with a single forward pass of the evaluator
+# It returns the raw policy logits: the search only needs the softmax over the legal moves (see evaluators.legal_priors),
+# so there is no point normalizing all 8100 actions
+# The search itself goes through self.evaluator.evaluate(), which for a network evaluator runs this same forward pass
+
+    def predict_batch(self, states):
+        """
+        Predict policy logits and values for a list of states in one forward pass.
+
+        Args:
+            states: A list of game states (15x10x9 NumPy arrays).
+
+        Returns:
+            policy_logits: A (K, 8100) array of policy logits ((K, 2238) for a compact policy head).
+            values: A (K,) array of value estimates.
+
+        Raises:
+            TypeError: If the evaluator does not produce policy logits (not an evaluators.LogitsEvaluator).
+        """
+        if not isinstance(self.evaluator, LogitsEvaluator):
+            raise TypeError(f"{type(self.evaluator).__name__} only gives priors of legal moves, not policy logits; "
+                            "use evaluator.evaluate(positions, legal_actions) instead")
+        return self.evaluator.predict_batch(states)
             
 # get_move_probabilities is one of the core functions of our AlphaZero implementation
 # It performs a complete iteration of Monte Carlo Tree Search (MCTS) from a given game position
-# It begins by creating a root MCTSNode for the current game position
-# Secondly, it uses the helper functions get_all_moves() and state_to_board(), 
-# to return the list of all legal moves for the present player 
+# It begins by creating an MCTSTree (struct-of-arrays tree, see mcts.py) whose root is the current game position
+# If the tree kept from the previous move (see update_with_move) is rooted at this same position, it is reused
+# and the new simulations are added on top of the visits it already has
+# Secondly, it uses the helper functions get_all_actions() and state_to_position(), 
+# to return all legal moves for the present player, already as an int array of action indices
 # If no legal moves are available, the game is finished and the function returns None
+# If there is exactly one legal move there is nothing to search, and the move is returned right away (probability 1)
 
-# Then our neural net comes into play, the neural network through predict() to obtains the policy logits and value
-# It retrieves the prior probabilities for the legal moves from the entire action space (8100 actions), utilizing move_to_action_index() to determine each move's index
-# These priors are normalized and used to expand the root node, assigning probabilities to its children
+# Then our neural net comes into play, the evaluator (evaluators.py) runs the neural network to obtain the policy logits and value
+# The action indices pick the legal logits out of the entire action space (8100 actions) and a softmax over just those gives the priors
+# These priors are used to expand the root node, assigning probabilities to its children
 
 # Then the process goes into the simulation loop
-# Running it num_simulations times. Within each simulation, it runs a selection step by traversing the tree from the root to a leaf according to the UCB formula
+# Running it until the budget is used up: num_simulations simulations, time_limit seconds or node_limit new nodes,
+# whichever comes first (see _remaining_simulations).
+# With early_stop the search also ends when the most visited root move leads the second one by more visits than
+# the budget has left, since no remaining simulation could change the chosen move
+# (self-play keeps it off: the training targets are the full visit distributions)
+# Within each simulation, it runs a selection step by traversing the tree from the root to a leaf according to the UCB formula
+# A single working Position follows the selection path with make_move() and is restored with unmake_move() afterwards,
+# so the leaf's position and network input planes are available without decoding any tensor
 
 # When it hits a leaf node (a node without children), it checks whether the game is over using is_king_captured()
 # Otherwise, it recursively expands the node by forming all potential child moves, retrieves their value and prior from the neural network, and adds them to the node
 
 # If the game is over (a king was captured), it assigns a terminal value of -1.0 to the node
 # If it is a draw (no legal moves), it assigns 0.0
+# With legal_moves the search generates fully legal moves (moves.get_legal_actions: no move leaves the own king in
+# check or facing the other king), so kings are never captured; a side without legal moves is then checkmated or
+# stalemated, both of which lose in Xiangqi, and the node gets -1.0
+
+# Leaves that need the network are evaluated in rounds of up to batch_size leaves
+# While a leaf waits for its evaluation, virtual loss is added along its path (one extra visit and -virtual_loss value),
+# which makes the next selections of the round prefer other branches; the virtual loss is removed before the real backup
+# If a round selects a leaf that is already pending, the round stops early and is evaluated
+# Terminal leaves and cache hits are backed up right away but still count toward the round's batch_size simulations,
+# so the budget is checked again after at most batch_size simulations even when no leaf needs the network
+
+# With an EvaluationCache, a leaf whose position was evaluated before (same Zobrist key) is expanded and backed up
+# right away from the cached priors and value, and only cache misses are sent to the network
 
 # Once a value is computed, it backpropagates this result along the saved path
 
+# With collect_stats the phases of the search are timed and counted into a SearchStats object (profiling.py)
+# Every hook sits behind `if stats:`, so a search without statistics does no extra work
+
 # Finally, after all simulations have been performed, the method builds a full-size action probability array (action_probs) of size 8100
-# It fills visit counts for every child node of the root, and then normalizes these counts to form a probability distribution
+# The root's children are one contiguous block of the tree, so their action indices and visit counts are scattered in one step,
+# and then normalized to form a probability distribution
 # These probabilities are used by select_move() to decide which move to make, either deterministically or by sampling depending on the temperature parameter
 
     def get_move_probabilities(self, state):
@@ -90,86 +199,255 @@ class AlphaZero:
         2. Expand root using legal moves and policy network priors.
         3. Run multiple simulations:
             - Traverse the tree via UCB until a leaf is reached
-            - Expand the leaf using NN output
+            - Expand the leaf using NN output (batch_size leaves per forward pass)
             - Backpropagate the value up the search path
         4. Return action probabilities proportional to visit counts.
         """
-        # Build a search tree and return move probabilities
-        root = MCTSNode(state)
+        root = MCTSTree.ROOT
+        stats = SearchStats() if self.collect_stats else None
+        self.last_stats = stats
         
         # Get valid moves
-        board = state_to_board(state)
-        red_to_move = state[14, 0, 0] > 0.5
-        valid_moves = get_all_moves(board, red_to_move)
+        position = state_to_position(state)
+        position.track_planes()
+        if stats:
+            stats.searches = 1
+            stats.lap("position")
+        valid_actions = self.generate_actions(position)
+        if stats:
+            stats.lap("movegen")
         
-        if not valid_moves:
+        if not len(valid_actions):
             return None  # Game over
         
-        # Get neural network's policy output
-        policy, _ = self.predict(state)
+        # Build a search tree, or keep the one reused from the previous move
+        reuse = self.tree is not None and self.root_position == position
         
-        # Extract probabilities for valid moves
-        valid_action_indices = [move_to_action_index(move) for move in valid_moves]
-        valid_priors = policy[valid_action_indices]
-        valid_priors = valid_priors / np.sum(valid_priors)  # Normalize
+        # Forced move: a single legal move needs no search
+        # The kept tree is dropped, since its root (possibly an unexpanded leaf) would not match the returned probabilities
+        if len(valid_actions) == 1:
+            self.tree = None
+            self.root_position = None
+            if stats:
+                stats.forced_moves = 1
+            action_probs = np.zeros(8100)
+            action_probs[valid_actions[0]] = 1.0
+            return action_probs
         
-        # Expand the root with all valid moves
-        root.expand(valid_priors, valid_moves)
+        tree = self.tree if reuse else MCTSTree()
+        initial_size = tree.size
+        start_time = time.perf_counter()
         
-        # Perform MCTS simulations
-        for _ in range(self.num_simulations):
-            # Selection
-            node = root
-            search_path = [node]
+        if tree.is_leaf(root):
+            # Get neural network's policy output (or the cached priors of this position)
+            cached = self.cache.get(position.key ^ self.cache_key_mask) if self.cache is not None else None
+            if cached is not None:
+                root_priors = cached[0]
+            else:
+                priors, values = self.evaluator.evaluate([position], [valid_actions])
+                root_priors = priors[0]
+                if self.cache is not None:
+                    self.cache.put(position.key ^ self.cache_key_mask, root_priors, float(values[0]))
+            if stats:
+                stats.cache_hits += cached is not None
+                stats.cache_misses += cached is None and self.cache is not None
+                stats.evaluations += cached is None
+                stats.evaluator_calls += cached is None
+                stats.lap("evaluate")
             
-            # Traverse tree until we reach a leaf
-            while node.children:
-                node = node.select_child()
-                search_path.append(node)
+            # Expand the root with all valid moves
+            if self.dirichlet_alpha is not None:
+                noise = np.random.dirichlet(np.full(len(valid_actions), self.dirichlet_alpha))
+                root_priors = (1 - self.noise_fraction) * np.asarray(root_priors) + self.noise_fraction * noise
+            tree.expand(root, root_priors, valid_actions)
+            if stats:
+                stats.expansions += 1
+                stats.children_total += len(valid_actions)
+                stats.lap("expand")
+        
+        # Perform MCTS simulations
+        use_virtual_loss = self.batch_size > 1
+        simulations = 0
+        # (at least 1, so the guaranteed first round can run even if num_simulations was set to 0 later)
+        max_simulations = max(self.num_simulations, 1) if self.num_simulations is not None else float("inf")
+        while True:
+            # Check the budget (and whether the best move is already decided) between rounds
+            # A search always completes at least one round, so the root has visits to return even with no time left
+            remaining = self._remaining_simulations(simulations, tree.size - initial_size,
+                                                    time.perf_counter() - start_time)
+            if remaining <= 0 and tree.visit_count[root] > 0:
+                break
+            if self.early_stop and self._best_move_decided(tree, remaining):
+                if stats:
+                    stats.early_stops += 1
+                break
             
-            # Check if the game is over
-            board = state_to_board(node.state)
-            red_to_move = node.state[14, 0, 0] > 0.5
-            game_over = is_king_captured(board)
+            pending = []
+            pending_leaves = set()
+            round_end = min(simulations + self.batch_size, max_simulations)
             
-            if not game_over:
-                # Expansion: Get neural network prediction
-                valid_moves = get_all_moves(board, red_to_move)
+            # Collect up to batch_size leaves (or terminal / cached simulations) for this round
+            while simulations < round_end:
+                search_path, captures = self._select_leaf(tree, position)
+                leaf = search_path[-1]
+                if stats:
+                    stats.depth_total += len(captures)
+                    stats.max_depth = max(stats.max_depth, len(captures))
+                    stats.lap("selection")
                 
-                if valid_moves:
-                    # Get neural network's policy output
-                    policy, value = self.predict(node.state)
-                    
-                    # Extract probabilities for valid moves
-                    valid_action_indices = [move_to_action_index(move) for move in valid_moves]
-                    valid_priors = policy[valid_action_indices]
-                    valid_priors = valid_priors / np.sum(valid_priors)  # Normalize
-                    
-                    # Expand the node
-                    node.expand(valid_priors, valid_moves)
+                # Check if the game is over
+                if is_king_captured(position):
+                    # Game over (king captured)
+                    tree.backup(search_path, -1.0)  # Loss for current player
+                    if stats:
+                        stats.terminal_leaves += 1
+                        stats.lap("backup")
                 else:
-                    # No valid moves (stalemate)
-                    value = 0.0
-            else:
-                # Game over (king captured)
-                value = -1.0  # Loss for current player
+                    valid_actions = self.generate_actions(position)
+                    if stats:
+                        stats.lap("movegen")
+                    if not len(valid_actions):
+                        # No valid moves (stalemate, or checkmate with legal_moves)
+                        tree.backup(search_path, self.no_moves_value)
+                        if stats:
+                            stats.terminal_leaves += 1
+                            stats.lap("backup")
+                    elif leaf in pending_leaves:
+                        # Same leaf selected twice in one round, evaluate what we have
+                        self._undo_path(tree, position, search_path, captures)
+                        if stats:
+                            stats.depth_total -= len(captures)
+                            stats.collisions += 1
+                            stats.lap("expand")
+                        break
+                    else:
+                        cached = (self.cache.get(position.key ^ self.cache_key_mask) if self.cache is not None
+                                  else None)
+                        if stats:
+                            stats.cache_hits += cached is not None
+                            stats.cache_misses += cached is None and self.cache is not None
+                            stats.lap("evaluate")
+                        if cached is not None:
+                            # Cache hit: expand and backpropagate without the network
+                            priors, value = cached
+                            tree.expand(leaf, priors, valid_actions)
+                            if stats:
+                                stats.expansions += 1
+                                stats.children_total += len(valid_actions)
+                                stats.lap("expand")
+                            tree.backup(search_path, value)
+                            if stats:
+                                stats.lap("backup")
+                            simulations += 1
+                            self._undo_path(tree, position, search_path, captures)
+                            if stats:
+                                stats.lap("expand")
+                            continue
+                        pending.append((search_path, valid_actions, position.copy()))
+                        pending_leaves.add(leaf)
+                        if use_virtual_loss:
+                            tree.add_virtual_loss(search_path, self.virtual_loss)
+                        if stats:
+                            stats.lap("backup")
+                
+                simulations += 1
+                self._undo_path(tree, position, search_path, captures)
+                if stats:
+                    stats.lap("expand")
+            
+            if not pending:
+                continue
             
-            # Backpropagate
-            for node in reversed(search_path):
-                node.update(-value)  # Negative because value is from perspective of other player
-                value = -value  # Flip value for next node
+            # Expansion: one evaluator (neural network) call for every pending leaf
+            leaf_priors, values = self.evaluator.evaluate([leaf for _, _, leaf in pending],
+                                                          [actions for _, actions, _ in pending])
+            if stats:
+                stats.evaluations += len(pending)
+                stats.evaluator_calls += 1
+                stats.lap("evaluate")
+            
+            for (search_path, valid_actions, leaf), priors, value in zip(pending, leaf_priors, values):
+                if use_virtual_loss:
+                    tree.remove_virtual_loss(search_path, self.virtual_loss)
+                
+                # Expand the node
+                value = float(value)
+                tree.expand(search_path[-1], priors, valid_actions)
+                if self.cache is not None:
+                    self.cache.put(leaf.key ^ self.cache_key_mask, priors, value)
+                if stats:
+                    stats.expansions += 1
+                    stats.children_total += len(valid_actions)
+                    stats.lap("expand")
+                
+                # Backpropagate (the sign flips at every level because values alternate between players)
+                tree.backup(search_path, value)
+                if stats:
+                    stats.lap("backup")
         
         # Return the action probabilities based on visit counts
         action_probs = np.zeros(8100)  # All possible actions
-        for move, child in root.children.items():
-            action_idx = move_to_action_index(move)
-            action_probs[action_idx] = child.visit_count
+        children = tree.children(root)
+        action_probs[tree.action[children]] = tree.visit_count[children]
         
         # Normalize
         action_probs = action_probs / np.sum(action_probs)
         
+        self.tree = tree
+        self.root_position = Position(position.squares, position.red_to_move)
+        if stats:
+            stats.simulations = simulations
+            stats.nodes_created = tree.size - initial_size
+            stats.lap("backup")
         return action_probs
     
+    # Simulations left in the budget: the tightest of the simulation, time and node limits
+    # Time and node budgets are converted into simulations at this search's own rate so far
+    def _remaining_simulations(self, simulations, nodes_created, elapsed):
+        remaining = float("inf")
+        if self.num_simulations is not None:
+            remaining = self.num_simulations - simulations
+        if self.time_limit is not None:
+            time_left = self.time_limit - elapsed
+            if time_left <= 0:
+                return 0
+            if simulations and elapsed > 0:
+                remaining = min(remaining, time_left * simulations / elapsed)
+        if self.node_limit is not None:
+            # A simulation that created no node (terminal leaf) still uses one node of the budget
+            nodes_used = max(nodes_created, simulations)
+            nodes_left = self.node_limit - nodes_used
+            if nodes_left <= 0:
+                return 0
+            if simulations and nodes_used:
+                remaining = min(remaining, nodes_left * simulations / nodes_used)
+        return remaining
+    
+    # True when the second most visited root move cannot catch up with the most visited one in `remaining` simulations
+    def _best_move_decided(self, tree, remaining):
+        visits = tree.visit_count[tree.children(MCTSTree.ROOT)]
+        if len(visits) < 2:
+            return True
+        second, best = np.partition(visits, -2)[-2:]
+        return best - second > remaining
+    
+    # Selection: traverse the tree from the root until we reach a leaf
+    # The working position is advanced along the path, captures holds the undo records
+    def _select_leaf(self, tree, position):
+        node = MCTSTree.ROOT
+        search_path = [node]
+        captures = []
+        while not tree.is_leaf(node):
+            node = tree.select_child(node)
+            search_path.append(node)
+            captures.append(position.make_action(int(tree.action[node])))
+        return search_path, captures
+    
+    # Undo the path moves so the working position is back at the root
+    def _undo_path(self, tree, position, search_path, captures):
+        for node, captured in zip(reversed(search_path[1:]), reversed(captures)):
+            position.unmake_action(int(tree.action[node]), captured)
+    
     def select_move(self, state, temperature=0.0):
         """
         Choose a move from the action probabilities output by MCTS.
@@ -187,16 +465,49 @@ class AlphaZero:
         if action_probs is None:
             return None  # Game over
         
-        # Select move based on temperature
+        # Convert action index to move
+        move = action_index_to_move(self.sample_action(action_probs, temperature))
+        return move
+    
+    # Select an action index based on temperature
+    # Also used directly by self-play, which needs the action probabilities as training targets
+    @staticmethod
+    def sample_action(action_probs, temperature=0.0):
         if temperature == 0:
             # Deterministic: choose the move with highest probability
-            action_idx = np.argmax(action_probs)
-        else:
-            # Apply temperature and sample
-            action_probs = action_probs ** (1.0 / temperature)
-            action_probs = action_probs / np.sum(action_probs)
-            action_idx = np.random.choice(len(action_probs), p=action_probs)
+            return int(np.argmax(action_probs))
         
-        # Convert action index to move
-        move = action_index_to_move(action_idx)
-        return move
\ No newline at end of file
+        # Apply temperature and sample
+        action_probs = action_probs ** (1.0 / temperature)
+        action_probs = action_probs / np.sum(action_probs)
+        return int(np.random.choice(len(action_probs), p=action_probs))
+    
+# Tree reuse
+# After a move is played on the board (by this agent or by the opponent) the game loop calls update_with_move()
+# The child of the root for that move becomes the new root and its subtree is kept, the rest of the tree is freed
+# If the move was never expanded under the root, the tree is simply dropped and the next search starts fresh
+
+    def update_with_move(self, move):
+        """
+        Re-root the kept search tree on a move that was just played.
+
+        Args:
+            move: The played move as a (i1, j1, i2, j2) tuple.
+        """
+        if self.tree is None:
+            return
+        
+        tree = self.tree
+        self.tree = None
+        children = tree.children(MCTSTree.ROOT)
+        matches = np.flatnonzero(tree.action[children] == move_to_action_index(move))
+        if len(matches):
+            self.tree = tree.subtree(children[matches[0]])
+            self.root_position.make_move(move)
+        else:
+            self.root_position = None
+    
+    def reset(self):
+        """Forget the kept search tree, e.g. before a new game."""
+        self.tree = None
+        self.root_position = None
@@ -2,8 +2,12 @@
 #Chinese Chess (Xiangqi) Environment Neural Network Module
 
 
+import copy
+
 import torch
 
+from moves import NUM_ACTIONS, NUM_COMPACT_ACTIONS, compact_actions
+
 # Neural network architecture
 # This code is generated for loading the neural network for Chinese Chess enviroement 
 # The model takes a board state as input and predicts the policy and value
@@ -28,27 +32,39 @@ class AZNet(torch.nn.Module):
     # Then, we define resiudual blocks which consist of 5 residual block architecture
     # In each block we have 2 convolutional layers  + batch norm after that to normalize the output values
 
-        
-    def __init__(self):
+    # compact=True sizes the policy head to the compact action space (moves.compact_actions) instead of all 8100
+    # (src, dst) pairs; logit k is then the logit of action compact_actions[k] (see moves.policy_columns)
+    # channels and num_blocks set the width and depth of the trunk (128 and 5 by default); smaller networks
+    # trained by distillation (distill.py) search several times more nodes per second
+    # head_channels sets the width of the policy head's 1x1 convolution (32 by default); p_fc has head_channels * 90
+    # inputs, so with the 8100-way head it holds most of the parameters (about 23M of 25M at the default size)
+    # and a small network has to shrink it as well as the trunk
+
+    def __init__(self, compact=False, channels=128, num_blocks=5, head_channels=32):
         super().__init__()
-        self.conv1 = torch.nn.Conv2d(15, 128, 3, padding=1)
+        self.compact = compact
+        self.channels = channels
+        self.num_blocks = num_blocks
+        self.head_channels = head_channels
+        self.conv1 = torch.nn.Conv2d(15, channels, 3, padding=1)
         self.res_blocks = torch.nn.Sequential(*[
             torch.nn.Sequential(
-                torch.nn.Conv2d(128,128,3,padding=1), torch.nn.BatchNorm2d(128), torch.nn.ReLU(),
-                torch.nn.Conv2d(128,128,3,padding=1), torch.nn.BatchNorm2d(128)
-            ) for _ in range(5)
+                torch.nn.Conv2d(channels,channels,3,padding=1), torch.nn.BatchNorm2d(channels), torch.nn.ReLU(),
+                torch.nn.Conv2d(channels,channels,3,padding=1), torch.nn.BatchNorm2d(channels)
+            ) for _ in range(num_blocks)
         ])
 
         # Policy Head Architecture
         # One 1x1 convolutional layer to decrease our hidden states then we flatten the architecture [32,10,9] to tensor size 2880 ( 32 * 9 * 10 ) 
         # Which corresponds to fully connected 8100 logit units which corresponds the legall moves (8100)
+        # (or 2238 units for the reachable moves only with compact=True)
         
-        self.p_conv = torch.nn.Conv2d(128, 32, 1)
-        self.p_fc   = torch.nn.Linear(32 * 10 * 9, 8100)
+        self.p_conv = torch.nn.Conv2d(channels, head_channels, 1)
+        self.p_fc   = torch.nn.Linear(head_channels * 10 * 9, NUM_COMPACT_ACTIONS if compact else NUM_ACTIONS)
 
         # Value Head
         # As we did in the policy head we first shrink the hidden states and flatten to 2880
-        self.v_conv = torch.nn.Conv2d(128, 32, 1)
+        self.v_conv = torch.nn.Conv2d(channels, 32, 1)
         self.v_fc1  = torch.nn.Linear(32 * 10 * 9, 128)
         self.v_fc2  = torch.nn.Linear(128, 1)
 
@@ -74,8 +90,120 @@ class AZNet(torch.nn.Module):
         return policy, value
 
 # Load the model
-def load_model(model_path="aznet_chinese_chess.pth"):
-    model = AZNet()
-    model.load_state_dict(torch.load(model_path))
+# quantize=True returns the dynamic INT8 variant (see quantize_model below)
+# The network size is read from the checkpoint (see model_config below)
+# compact=None keeps the policy head of the checkpoint, compact=True converts an 8100-way checkpoint to the compact head
+def load_model(model_path="aznet_chinese_chess.pth", quantize=False, compact=None):
+    state_dict = torch.load(model_path)
+    if compact:
+        state_dict = compact_state_dict(state_dict)
+    model = AZNet(**model_config(state_dict))
+    model.load_state_dict(state_dict)
     model.eval()
-    return model
\ No newline at end of file
+    if quantize:
+        model = quantize_model(model)
+    return model
+
+# AZNet constructor arguments matching a state dict (policy head layout, trunk width, number of residual blocks and
+# policy head width)
+def model_config(state_dict):
+    return {
+        "compact": is_compact_state_dict(state_dict),
+        "channels": state_dict["conv1.weight"].shape[0],
+        "num_blocks": len({key.split(".")[1] for key in state_dict if key.startswith("res_blocks.")}),
+        "head_channels": state_dict["p_conv.weight"].shape[0],
+    }
+
+# Checkpoint conversion to the compact policy head
+# Every row of the 8100-way p_fc belongs to one action index, and the compact head keeps exactly the rows of
+# compact_actions (the other rows are actions no piece can ever make, so the conversion changes no legal logit)
+
+def is_compact_state_dict(state_dict):
+    return state_dict["p_fc.weight"].shape[0] == NUM_COMPACT_ACTIONS
+
+def compact_state_dict(state_dict):
+    if is_compact_state_dict(state_dict):
+        return state_dict
+    state_dict = state_dict.copy()
+    rows = torch.from_numpy(compact_actions)
+    state_dict["p_fc.weight"] = state_dict["p_fc.weight"][rows].clone()
+    state_dict["p_fc.bias"] = state_dict["p_fc.bias"][rows].clone()
+    return state_dict
+
+# Dynamic INT8 quantization
+# p_fc (2880 x 8100, about 23M of the model's parameters), v_fc1 and v_fc2 are stored as int8 weights and their matmuls
+# run in int8 with activations quantized on the fly, which cuts the weight memory of the model by roughly 4x
+# The convolutional trunk stays in float
+# quantize_tool.py measures how closely the quantized model agrees with the float one
+
+QUANTIZED_LAYERS = {"p_fc", "v_fc1", "v_fc2"}
+
+def quantize_model(model):
+    model = copy.deepcopy(model).eval()
+    return torch.ao.quantization.quantize_dynamic(model, QUANTIZED_LAYERS, dtype=torch.qint8)
+
+# Inference build
+# For search the model only ever runs forward passes on small batches, where per-call framework overhead dominates
+# build_inference_model() returns a copy of the model prepared for that:
+# Each Conv2d + BatchNorm2d pair in res_blocks is folded into a single Conv2d (eval-mode BN is an affine map per channel)
+# Optionally the weights (and inputs) use the channels_last memory format
+# quantize=True additionally applies the dynamic INT8 quantization of the linear layers (see quantize_model)
+# The result is TorchScript-compiled and frozen (backend="script"), torch.compile'd (backend="compile") or left eager (None)
+# Run it under torch.inference_mode() (AlphaZero.predict / predict_batch already do)
+
+def fuse_conv_bn(model):
+    model = copy.deepcopy(model).eval()
+    fused_blocks = []
+    for block in model.res_blocks:
+        layers = list(block)
+        fused = []
+        k = 0
+        while k < len(layers):
+            if (isinstance(layers[k], torch.nn.Conv2d) and k + 1 < len(layers)
+                    and isinstance(layers[k + 1], torch.nn.BatchNorm2d)):
+                fused.append(torch.nn.utils.fusion.fuse_conv_bn_eval(layers[k], layers[k + 1]))
+                k += 2
+            else:
+                fused.append(layers[k])
+                k += 1
+        fused_blocks.append(torch.nn.Sequential(*fused))
+    model.res_blocks = torch.nn.Sequential(*fused_blocks)
+    return model
+
+# Converts its input to channels_last before running the wrapped model
+class ChannelsLast(torch.nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, x):
+        return self.model(x.contiguous(memory_format=torch.channels_last))
+
+def build_inference_model(model, channels_last=False, backend="script", quantize=False):
+    model = fuse_conv_bn(model)
+    if quantize:
+        model = quantize_model(model)
+    if channels_last:
+        model = ChannelsLast(model.to(memory_format=torch.channels_last)).eval()
+    if backend == "script":
+        model = torch.jit.freeze(torch.jit.script(model))
+    elif backend == "compile":
+        model = torch.compile(model, dynamic=True)
+    elif backend is not None:
+        raise ValueError(f"Unknown backend: {backend}")
+    return model
+
+# ONNX export (for evaluators.OnnxEvaluator)
+# The exported graph is the conv-BN fused model with a dynamic batch dimension,
+# input "states" (B, 15, 10, 9) and outputs "policy_logits" and "values"
+def export_onnx(model, path):
+    model = fuse_conv_bn(model)
+    states = torch.zeros(1, 15, 10, 9)
+    torch.onnx.export(model, (states,), path, input_names=["states"], output_names=["policy_logits", "values"],
+                      dynamic_axes={"states": {0: "batch"}, "policy_logits": {0: "batch"}, "values": {0: "batch"}},
+                      dynamo=False)
+
+# Load a checkpoint directly as an inference build
+def load_inference_model(model_path="aznet_chinese_chess.pth", channels_last=False, backend="script", quantize=False,
+                         compact=None):
+    return build_inference_model(load_model(model_path, compact=compact), channels_last, backend, quantize)
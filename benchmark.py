@@ -0,0 +1,168 @@
+#EE6892 Reinforcement Learning
+#Chinese Chess (Xiangqi) Benchmark Module
+
+# End-to-end performance numbers for capacity planning and regression tracking, written as one JSON document:
+# search: simulations/sec of AlphaZero.get_move_probabilities at several num_simulations (fresh tree per position)
+# inference: AZNet forward latency (median ms) and throughput (positions/sec) for batch sizes 1 to 256
+# tree_memory: nodes and bytes of the largest search tree, both for the MCTSTree arrays the search uses and for the
+#              same tree as MCTSNode objects (tree.to_node(), measured with tracemalloc)
+# selfplay: games/hour and positions/sec of selfplay.run_selfplay (games are capped at max_moves plies)
+# Everything runs with a randomly initialized AZNet unless a checkpoint is given; --evaluator fake replaces the network
+# with evaluators.FakeEvaluator to measure the search alone
+
+# Comparing two runs: --baseline old.json prints the ratio new / old for every measured number of the current run
+
+# Usage:
+# python benchmark.py --output bench.json
+# python benchmark.py --simulations 100 400 --batch-sizes 1 8 64 --skip-selfplay --baseline bench.json
+
+import argparse
+import json
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import torch
+
+from alphazero import AlphaZero
+from aznet import AZNet, load_model, build_inference_model
+from board import position_to_state
+from evaluators import FakeEvaluator
+from export_model import measure_latency
+from utils import random_positions
+
+
+def bench_search(model, simulations=(50, 100, 200, 400), batch_size=8, num_positions=5, seed=0):
+    states = [position_to_state(position) for position in random_positions(num_positions, seed)]
+    results = {}
+    largest = None
+    for num_simulations in simulations:
+        agent = AlphaZero(model, num_simulations, batch_size)
+        start = time.perf_counter()
+        for state in states:
+            agent.reset()
+            agent.get_move_probabilities(state)
+            if largest is None or agent.tree.size > largest.size:
+                largest = agent.tree
+        elapsed = time.perf_counter() - start
+        results[str(num_simulations)] = {
+            "seconds_per_search": elapsed / num_positions,
+            "simulations_per_second": num_simulations * num_positions / elapsed,
+        }
+    return results, largest
+
+
+def bench_inference(model, batch_sizes=(1, 2, 4, 8, 16, 32, 64, 128, 256), repeats=10):
+    latency = measure_latency(model, batch_sizes, repeats)
+    return {str(batch_size): {"latency_ms": ms, "positions_per_second": batch_size / ms * 1000}
+            for batch_size, ms in latency.items()}
+
+
+# Size of one search tree as MCTSTree arrays and as the equivalent MCTSNode objects
+def tree_memory(tree):
+    tracemalloc.start()
+    nodes = tree.to_node()
+    node_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del nodes
+    return {
+        "nodes": int(tree.size),
+        "tree_bytes_used": int(tree.nbytes // tree.capacity * tree.size),
+        "tree_bytes_allocated": int(tree.nbytes),
+        "mcts_node_bytes": int(node_bytes),
+    }
+
+
+def bench_selfplay(model_path=None, workers=1, games=2, simulations=50, batch_size=8, max_moves=60):
+    from selfplay import run_selfplay
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        summary = run_selfplay(workers, games, output_dir, model_path, simulations, batch_size, max_moves)
+    summary["config"] = {"workers": workers, "games": games, "simulations": simulations, "batch_size": batch_size,
+                         "max_moves": max_moves}
+    return summary
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "torch": torch.__version__,
+        "torch_threads": torch.get_num_threads(),
+        "numpy": np.__version__,
+    }
+
+
+# Prints new / old for every measured number present in both runs (search rates, latencies, memory, ...)
+def compare(baseline, current, prefix=""):
+    for key, value in current.items():
+        if key in ("environment", "config"):
+            continue
+        old = baseline.get(key) if isinstance(baseline, dict) else None
+        if isinstance(value, dict):
+            compare(old if isinstance(old, dict) else {}, value, f"{prefix}{key}.")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool) and isinstance(old, (int, float)) and old:
+            print(f"{prefix}{key}: {old:.4g} -> {value:.4g} ({value / old:.2f}x)")
+
+
+def run_benchmarks(model_path=None, evaluator="torch", simulations=(50, 100, 200, 400), search_batch_size=8,
+                   batch_sizes=(1, 2, 4, 8, 16, 32, 64, 128, 256), selfplay=True, selfplay_games=2, workers=1,
+                   selfplay_simulations=50, max_moves=60):
+    model = load_model(model_path) if model_path else AZNet().eval()
+    if evaluator == "script":
+        search_model = build_inference_model(model)
+    elif evaluator == "fake":
+        search_model = FakeEvaluator()
+    else:
+        search_model = model
+
+    results = {"environment": environment(),
+               "config": {"model": model_path or "random AZNet", "evaluator": evaluator,
+                          "search_batch_size": search_batch_size}}
+    results["search"], largest = bench_search(search_model, simulations, search_batch_size)
+    results["tree_memory"] = tree_memory(largest)
+    results["inference"] = bench_inference(model, batch_sizes)
+    if selfplay:
+        results["selfplay"] = bench_selfplay(model_path, workers, selfplay_games, selfplay_simulations,
+                                             search_batch_size, max_moves)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search, inference, memory and self-play benchmarks")
+    parser.add_argument("--model", default=None, help="AZNet checkpoint (random weights if omitted)")
+    parser.add_argument("--evaluator", default="torch", choices=["torch", "script", "fake"],
+                        help="what evaluates leaves in the search benchmark")
+    parser.add_argument("--simulations", type=int, nargs="+", default=[50, 100, 200, 400])
+    parser.add_argument("--search-batch-size", type=int, default=8)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64, 128, 256])
+    parser.add_argument("--skip-selfplay", action="store_true")
+    parser.add_argument("--selfplay-games", type=int, default=2)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--selfplay-simulations", type=int, default=50)
+    parser.add_argument("--max-moves", type=int, default=60)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--output", default=None, help="write the results as JSON here")
+    parser.add_argument("--baseline", default=None, help="JSON of an earlier run to compare against")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    results = run_benchmarks(args.model, args.evaluator, args.simulations, args.search_batch_size, args.batch_sizes,
+                             not args.skip_selfplay, args.selfplay_games, args.workers, args.selfplay_simulations,
+                             args.max_moves)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(json.load(f), results)
+
+
+if __name__ == "__main__":
+    main()
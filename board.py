@@ -5,11 +5,16 @@
 # Piece encodings
 # Initial board setup
 # Board visualization
+# Compact Position type (bytearray of piece codes + side to move) used by the search
+# Zobrist position keys
+# FEN-like text notation for positions
 # Conversion between board ↔ tensor state
 # Game logic /  move application and king-checking
 
 
 #Importing the necessary modules
+import random
+
 import numpy as np
 
 
@@ -94,11 +99,220 @@ def print_board(board):
         else:
             print("\n  └───┴───┴───┴───┴───┴───┴───┴───┴───┘")
                 
-# We need to convert the board into 15-channel tensor state as we discussed previosuly
+# Compact position representation
+# The search never touches the 10x9 list-of-strings board above; that layout is only kept for printing and the UI
+# A Position stores the 90 squares (row-major, square = i * 9 + j) in a bytearray of integer piece codes plus the side to move
+# Piece code = channel + 1, so 0 is an empty square, 1-7 are the red pieces and 8-14 are the black pieces
+# Colour checks are integer comparisons and the piece type of any code is (code - 1) % 7
+
+EMPTY = 0
+piece_to_code = {piece: chan + 1 for piece, chan in piece_to_channel.items()}
+code_to_piece = "." + "KABNRCPkabnrcp"
+
+RED_KING = piece_to_code['K']
+BLACK_KING = piece_to_code['k']
+
+# Piece types shared by both colours (code - 1) % 7
+KING, ADVISOR, ELEPHANT, HORSE, CHARIOT, CANNON, PAWN = range(7)
+
+# Zobrist hashing
+# Every (piece code, square) pair and the side to move get a fixed random 64-bit number
+# A position's key is the XOR of the numbers of all its pieces, plus zobrist_black_to_move when Black is to move
+# A move only changes a few terms, so make_move / unmake_move update the key with 3-4 XORs
+# The entries of the empty code are 0, so XOR-ing out a non-capture's "captured" piece is a no-op
+# The table comes from a fixed seed so keys are identical across processes and runs (they can be shared or stored)
+
+_zobrist_rng = random.Random(6892)
+zobrist_pieces = [0 if code == EMPTY else _zobrist_rng.getrandbits(64) for code in range(15) for _ in range(90)]
+zobrist_black_to_move = _zobrist_rng.getrandbits(64)
+
+def zobrist_key(position):
+    key = 0 if position.red_to_move else zobrist_black_to_move
+    for sq, code in enumerate(position.squares):
+        if code != EMPTY:
+            key ^= zobrist_pieces[code * 90 + sq]
+    return key
+
+# The same key computed straight from a 15x10x9 input tensor (board_to_state / position_to_state output)
+def state_zobrist_key(state):
+    return zobrist_key(state_to_position(state))
+
+# Each position also tracks both king squares (-1 once a king is captured) so terminal checks are O(1)
+# make_move / unmake_move (make_action / unmake_action for action indices) update only the source and destination squares
+# and return / take an undo record (the captured code)
+# When track_planes() has been called the 15x10x9 network input planes are kept in sync by the same two-square update
+# key is the Zobrist hash of the position, also updated incrementally
+
+class Position:
+    __slots__ = ("squares", "red_to_move", "red_king", "black_king", "planes", "flat_planes", "key")
+
+    def __init__(self, squares=None, red_to_move=True):
+        self.squares = bytearray(90) if squares is None else bytearray(squares)
+        self.red_to_move = red_to_move
+        self.red_king = self.squares.find(RED_KING)
+        self.black_king = self.squares.find(BLACK_KING)
+        self.planes = None
+        self.flat_planes = None
+        self.key = zobrist_key(self)
+
+    # The copy takes over the king squares and key instead of recomputing them
+    def copy(self):
+        position = Position.__new__(Position)
+        position.squares = bytearray(self.squares)
+        position.red_to_move = self.red_to_move
+        position.red_king = self.red_king
+        position.black_king = self.black_king
+        position.key = self.key
+        position.planes = None
+        position.flat_planes = None
+        if self.planes is not None:
+            position.planes = self.planes.copy()
+            position.flat_planes = position.planes.reshape(15, 90)
+        return position
+
+    def __eq__(self, other):
+        return (isinstance(other, Position) and self.squares == other.squares
+                and self.red_to_move == other.red_to_move)
+
+    # Start maintaining the network input planes incrementally and return them
+    # flat_planes is a (15, 90) view of the same memory, indexed by square
+    def track_planes(self):
+        if self.planes is None:
+            self.planes = position_to_state(self)
+            self.flat_planes = self.planes.reshape(15, 90)
+        return self.planes
+
+    # The search plays moves in action index form (src * 90 + dst, see moves.move_to_action_index)
+    def make_action(self, action):
+        src, dst = divmod(action, 90)
+        squares = self.squares
+        piece = squares[src]
+        captured = squares[dst]
+        squares[dst] = piece
+        squares[src] = EMPTY
+        key = self.key ^ zobrist_black_to_move ^ zobrist_pieces[piece * 90 + src] ^ zobrist_pieces[piece * 90 + dst]
+        self.key = key ^ zobrist_pieces[captured * 90 + dst]
+
+        if piece == RED_KING:
+            self.red_king = dst
+        elif piece == BLACK_KING:
+            self.black_king = dst
+        if captured == RED_KING:
+            self.red_king = -1
+        elif captured == BLACK_KING:
+            self.black_king = -1
+        self.red_to_move = not self.red_to_move
+
+        planes = self.flat_planes
+        if planes is not None:
+            planes[piece - 1, src] = 0
+            if captured != EMPTY:
+                planes[captured - 1, dst] = 0
+            planes[piece - 1, dst] = 1
+            planes[14] = self.red_to_move
+        return captured
+
+    def unmake_action(self, action, captured):
+        src, dst = divmod(action, 90)
+        squares = self.squares
+        piece = squares[dst]
+        squares[src] = piece
+        squares[dst] = captured
+        key = self.key ^ zobrist_black_to_move ^ zobrist_pieces[piece * 90 + src] ^ zobrist_pieces[piece * 90 + dst]
+        self.key = key ^ zobrist_pieces[captured * 90 + dst]
+
+        if piece == RED_KING:
+            self.red_king = src
+        elif piece == BLACK_KING:
+            self.black_king = src
+        if captured == RED_KING:
+            self.red_king = dst
+        elif captured == BLACK_KING:
+            self.black_king = dst
+        self.red_to_move = not self.red_to_move
+
+        planes = self.flat_planes
+        if planes is not None:
+            planes[piece - 1, dst] = 0
+            if captured != EMPTY:
+                planes[captured - 1, dst] = 1
+            planes[piece - 1, src] = 1
+            planes[14] = self.red_to_move
+
+    # Same as make_action / unmake_action for (i1, j1, i2, j2) move tuples
+    def make_move(self, move):
+        i1, j1, i2, j2 = move
+        return self.make_action((i1 * 9 + j1) * 90 + i2 * 9 + j2)
+
+    def unmake_move(self, move, captured):
+        i1, j1, i2, j2 = move
+        self.unmake_action((i1 * 9 + j1) * 90 + i2 * 9 + j2, captured)
+
+def init_position():
+    return board_to_position(init_board(), True)
+
+# Conversions between the list board (UI edge) and the compact position
+
+def board_to_position(board, red_to_move=True):
+    squares = bytearray(piece_to_code.get(piece, EMPTY) for row in board for piece in row)
+    return Position(squares, red_to_move)
+
+def position_to_board(position):
+    flat = [code_to_piece[code] for code in position.squares]
+    return [flat[i * 9:(i + 1) * 9] for i in range(10)]
+
+# FEN-like text notation (as used by UCCI engines and Xiangqi perft suites)
+# Ranks from Black's back rank (row 0) down to Red's (row 9) separated by '/', digits for runs of empty squares,
+# then the side to move ('w' or 'r' for Red, 'b' for Black); anything after that (castling/move counters) is ignored
+# Pieces use this file's letters, and the other common letters E (elephant) and H (horse) are accepted as well
+# The standard opening is START_FEN; init_position() is the opening as set up by init_board()
+
+START_FEN = "rnbakabnr/9/1c5c1/p1p1p1p1p/9/9/P1P1P1P1P/1C5C1/9/RNBAKABNR w - - 0 1"
+
+fen_piece_aliases = {'E': 'B', 'H': 'N', 'e': 'b', 'h': 'n'}
+
+def fen_to_position(fen):
+    fields = fen.split()
+    ranks = fields[0].split("/")
+    if len(ranks) != 10:
+        raise ValueError(f"FEN needs 10 ranks, got {len(ranks)}: {fen}")
+    squares = bytearray()
+    for rank in ranks:
+        row = bytearray()
+        for char in rank:
+            if char.isdigit():
+                row.extend(bytes(int(char)))
+            else:
+                piece = fen_piece_aliases.get(char, char)
+                if piece not in piece_to_code:
+                    raise ValueError(f"Unknown piece '{char}' in FEN: {fen}")
+                row.append(piece_to_code[piece])
+        if len(row) != 9:
+            raise ValueError(f"FEN rank '{rank}' does not have 9 squares: {fen}")
+        squares.extend(row)
+    side = fields[1] if len(fields) > 1 else "w"
+    if side not in ("w", "r", "b"):
+        raise ValueError(f"Unknown side to move '{side}' in FEN: {fen}")
+    return Position(squares, side != "b")
+
+def position_to_fen(position):
+    ranks = []
+    for i in range(10):
+        rank, empty = "", 0
+        for code in position.squares[i * 9:(i + 1) * 9]:
+            if code == EMPTY:
+                empty += 1
+                continue
+            if empty:
+                rank += str(empty)
+                empty = 0
+            rank += code_to_piece[code]
+        ranks.append(rank + (str(empty) if empty else ""))
+    return "/".join(ranks) + (" w" if position.red_to_move else " b") + " - - 0 1"
+
+# We need to convert the position into 15-channel tensor state as we discussed previosuly
 # So first we initalize a three dimensional tensor with a shape (15, 10, 9) where 15 is the total channels and 10,9 is our Chinese Chess board size
-# We loop over the board and get the characters for each place
-# If there is a piece in that place we use our piece to channel function to find the correct tensor shape
-# Then we set the channel at state (i,j) to 1 which where start one-hot encoding teh piece locations
+# Every occupied square sets a 1 in the channel of its piece (code - 1), which is one vectorized scatter instead of a Python loop
 
 # We do this for 13 channels ( + 1 self channel ) but our 15th channel has a different purpose
 # 15th channel is a 10x9 plane full of 1's if its RED turn and 0 otherwise
@@ -109,65 +323,56 @@ def print_board(board):
 # Who owns which piece
 # Whose turn it is
 
-def board_to_state(board, red_to_move=True):
-    state = np.zeros((15, 10, 9), dtype=np.float32)
+def position_to_state(position):
+    state = np.zeros((15, 90), dtype=np.float32)
+    codes = np.frombuffer(position.squares, dtype=np.uint8)
+    occupied = np.flatnonzero(codes)
+    state[codes[occupied] - 1, occupied] = 1
+    if position.red_to_move:
+        state[14, :] = 1
+    return state.reshape(15, 10, 9)
 
-    # Define the board shape
-    for i in range(10):
-        for j in range(9):
-            #For the specific piece 
-            piece = board[i][j]
-            if piece != '.':
-                chan = piece_to_channel[piece]
-                state[chan, i, j] = 1
-    state[14, :, :] = 1 if red_to_move else 0
-    return state
+# state_to_position function is the exact reverse of position_to_state
+# The function takes a tensor which has a dimension of 15x10x9 and rebuilds the piece codes with a single vectorized scatter
+
+def state_to_position(state):
+    chans, squares = np.nonzero(np.asarray(state[:14]).reshape(14, 90) > 0.5)
+    codes = np.zeros(90, dtype=np.uint8)
+    codes[squares] = chans + 1
+    return Position(codes.tobytes(), bool(state[14, 0, 0] > 0.5))
 
-# state_to_board function is the exact reverse of our board_state_funciton
-# The function takes a tensor which has a dimension of 15x10x9 and build a board with that information
+# The list-board versions are kept for the notebook and the UI
+# They go through the compact position so there is a single encoding
+
+def board_to_state(board, red_to_move=True):
+    return position_to_state(board_to_position(board, red_to_move))
 
 def state_to_board(state):
-    board = [["." for _ in range(9)] for _ in range(10)]
-    pieces = "KABNRCPkabnrcp"
-    for chan, piece in enumerate(pieces):
-        if chan >= 14:
-            break
-        for i in range(10):
-            for j in range(9):
-                if state[chan, i, j] > 0.5:
-                    board[i][j] = piece
-    return board
+    return position_to_board(state_to_position(state))
 
 # Defining the Rules
 # We need to define a game-over condition checker in Xiangqi
 # The function is_king_captured returns 1 if the King has been captured, 0 otherwise
 # The game ends immediately if a King ('K' for Red, 'k' for Black) is captured
+# The position already knows both king squares, so this is O(1) instead of a 90-square scan
 
-def is_king_captured(board):
-    red_king_found = False
-    black_king_found = False
-    
-    for i in range(10):
-        for j in range(9):
-            if board[i][j] == 'K':
-                red_king_found = True
-            elif board[i][j] == 'k':
-                black_king_found = True
-    
-    return not (red_king_found and black_king_found)
+def is_king_captured(position):
+    return position.red_king < 0 or position.black_king < 0
 
 # We need to apply a move, get the next state and flip the board
 # That's why we define a make_move function which helps us 
+# Instead of decoding the whole tensor into a board and re-encoding it, we copy the state and
+# move the one-hot piece vector of the source square onto the destination (which also clears any captured piece)
 
 def make_move(state, move):
-        
-    board = state_to_board(state)
-    red_to_move = state[14, 0, 0] > 0.5
     
-    # Apply move
     i1, j1, i2, j2 = move
-    board[i2][j2] = board[i1][j1]
-    board[i1][j1] = '.'
+    new_state = state.copy()
+    
+    # Apply move
+    new_state[:14, i2, j2] = state[:14, i1, j1]
+    new_state[:14, i1, j1] = 0
     
     # Return new state with updated player
-    return board_to_state(board, not red_to_move)
\ No newline at end of file
+    new_state[14] = 1 - state[14]
+    return new_state
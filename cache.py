@@ -0,0 +1,89 @@
+#EE6892 Reinforcement Learning
+#Chinese Chess (Xiangqi) Neural Evaluation Cache Module
+
+# The same positions are reached many times during a game: transpositions inside one search tree,
+# and the shared subtree between the search for one move and the search for the next
+# Every time the search evaluates a position it pays a full AZNet forward pass
+# EvaluationCache remembers the result of those evaluations, keyed by the position's Zobrist key (board.py)
+
+# What we store per position:
+# priors: the normalized priors of the moves, in the order of the move generator that listed them (move generation is
+#         deterministic, so the same position always lists its moves in the same order)
+# value: the network's value estimate for the side to move
+
+# The search has two move generators, moves.get_all_actions (pseudo-legal) and moves.get_legal_actions, and the
+# priors of one do not line up with the moves of the other
+# An agent searching legal moves therefore XORs LEGAL_MOVES_KEY into the Zobrist key (AlphaZero legal_moves, and
+# evaluators.CachedEvaluator legal_moves), so a cache shared between both kinds of agents keeps their entries apart
+
+# The cache is bounded by max_entries and, optionally, by max_bytes of stored priors, and evicts the least recently
+# used position (LRU)
+# max_bytes counts the priors arrays only; the per-entry bookkeeping of the dict, tuple and value (a couple of hundred
+# bytes per entry in CPython) comes on top and is what max_entries bounds
+# One cache object can be handed to several AlphaZero agents / searches to share evaluations within a game
+
+import random
+from collections import OrderedDict
+
+
+# Fixed random 64-bit number (like the Zobrist table, identical across processes and runs)
+LEGAL_MOVES_KEY = random.Random(68920).getrandbits(64)
+
+
+class EvaluationCache:
+    def __init__(self, max_entries=100_000, max_bytes=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        # Bytes of all stored priors arrays
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    # Returns (priors, value) for a position key, or None on a miss
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key, priors, value):
+        entries = self.entries
+        old = entries.get(key)
+        if old is not None:
+            self.nbytes -= old[0].nbytes
+        entries[key] = (priors, value)
+        entries.move_to_end(key)
+        self.nbytes += priors.nbytes
+        while len(entries) > self.max_entries or (self.max_bytes is not None and self.nbytes > self.max_bytes
+                                                  and len(entries) > 1):
+            _, (evicted, _) = entries.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+        self.nbytes = 0
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    # Counters as a plain dict, handy for logging
+    def stats(self):
+        return {
+            "entries": len(self.entries),
+            "bytes": self.nbytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hit_rate,
+        }
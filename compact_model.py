@@ -0,0 +1,46 @@
+#EE6892 Reinforcement Learning
+#Chinese Chess (Xiangqi) Compact Policy Head Conversion Module
+
+# Converts an AZNet checkpoint with the 8100-way policy head into one with the compact head (moves.compact_actions)
+# The compact p_fc keeps the rows of the reachable actions only (aznet.compact_state_dict), so every legal move
+# keeps exactly the same logit; the converted model is checked against the original on random playout positions
+
+# Usage:
+# python compact_model.py aznet_chinese_chess.pth aznet_compact.pth
+
+import argparse
+import os
+
+import torch
+
+from aznet import AZNet, compact_state_dict, is_compact_state_dict, model_config
+from export_model import parity_check
+from moves import NUM_ACTIONS, NUM_COMPACT_ACTIONS
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Remap an 8100-way AZNet checkpoint to the compact policy head")
+    parser.add_argument("model", help="AZNet checkpoint with the 8100-way policy head")
+    parser.add_argument("output", help="where to save the compact checkpoint")
+    parser.add_argument("--positions", type=int, default=256, help="positions for the parity check")
+    args = parser.parse_args()
+
+    state_dict = torch.load(args.model)
+    if is_compact_state_dict(state_dict):
+        raise SystemExit(f"{args.model} already has the compact policy head")
+    compact = compact_state_dict(state_dict)
+    torch.save(compact, args.output)
+    print(f"Policy head {NUM_ACTIONS} -> {NUM_COMPACT_ACTIONS} outputs, checkpoint "
+          f"{os.path.getsize(args.model) / 2**20:.1f} MB -> {os.path.getsize(args.output) / 2**20:.1f} MB")
+
+    original = AZNet(**model_config(state_dict))
+    original.load_state_dict(state_dict)
+    converted = AZNet(**model_config(compact))
+    converted.load_state_dict(compact)
+    parity = parity_check(original.eval(), converted.eval(), args.positions)
+    print(f"Parity on {parity['positions']} positions: max logit error {parity['max_logit_error']:.2e}, "
+          f"max value error {parity['max_value_error']:.2e}, top-1 match {parity['top1_match_rate']:.1%}")
+
+
+if __name__ == "__main__":
+    main()
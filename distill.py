@@ -0,0 +1,145 @@
+#EE6892 Reinforcement Learning
+#Chinese Chess (Xiangqi) Distillation Module
+
+# Trains a small AZNet (the student: fewer channels, residual blocks and policy head channels) to reproduce a trained
+# AZNet (the teacher) on the positions stored in a replay directory, then reports what the smaller network buys
+# Training is train.train with a teacher: the targets are the teacher's legal-move policy and value instead of the
+# MCTS visits and game outcomes (outcome_weight mixes some of the real outcome back into the value target)
+
+# Trade-off report:
+# nodes/sec: MCTS simulations per second of each network on random playout positions
+# agreement: top-1 legal move match rate and value error of the student against the teacher
+# strength: a match of the student searching student_simulations per move against the teacher searching simulations
+# The interesting question for interactive play (utils.play_interactive) is whether the student with ~4x the
+# simulations in the same time is at least as strong as the teacher, e.g.
+# play_interactive(model, AlphaZero(load_model("aznet_small.pth"), num_simulations=400, batch_size=8))
+
+# Usage:
+# python distill.py replay_data --teacher aznet_chinese_chess.pth --channels 64 --blocks 3 --head-channels 4 --steps 5000 --output aznet_small.pth
+
+import argparse
+import time
+
+import numpy as np
+import torch
+
+from alphazero import AlphaZero
+from aznet import AZNet, load_model
+from board import init_position, position_to_state, is_king_captured, make_move
+from export_model import parity_check
+from train import train
+from utils import random_positions
+
+
+# MCTS simulations per second of a model, averaged over searches from random positions
+def search_speed(model, num_simulations=100, batch_size=8, num_positions=10, seed=0):
+    states = [position_to_state(position) for position in random_positions(num_positions, seed)]
+    agent = AlphaZero(model, num_simulations, batch_size)
+    start = time.perf_counter()
+    for state in states:
+        agent.reset()
+        agent.get_move_probabilities(state)
+    return num_simulations * num_positions / (time.perf_counter() - start)
+
+
+# Plays games between two agents, alternating colours, and returns (wins, draws, losses) from agent_a's view
+# The first opening_plies plies are sampled with temperature 1 so the games differ, later moves are greedy
+# A game is drawn when a side has no moves or after max_moves plies
+
+def play_match(agent_a, agent_b, num_games=10, max_moves=200, opening_plies=4, seed=0):
+    np.random.seed(seed)
+    wins = draws = losses = 0
+    for game in range(num_games):
+        red, black = (agent_a, agent_b) if game % 2 == 0 else (agent_b, agent_a)
+        position = init_position()
+        state = position_to_state(position)
+        red.reset()
+        black.reset()
+        winner = None
+        for ply in range(max_moves):
+            agent = red if position.red_to_move else black
+            move = agent.select_move(state, temperature=1.0 if ply < opening_plies else 0.0)
+            if move is None:
+                break
+            state = make_move(state, move)
+            position.make_move(move)
+            red.update_with_move(move)
+            black.update_with_move(move)
+            if is_king_captured(position):
+                winner = agent
+                break
+        if winner is None:
+            draws += 1
+        elif winner is agent_a:
+            wins += 1
+        else:
+            losses += 1
+    return wins, draws, losses
+
+
+def tradeoff_report(teacher, student, simulations=100, student_simulations=400, batch_size=8, num_games=10,
+                    max_moves=200):
+    teacher_speed = search_speed(teacher, simulations, batch_size)
+    student_speed = search_speed(student, student_simulations, batch_size)
+    parity = parity_check(teacher, student)
+    wins, draws, losses = play_match(AlphaZero(student, student_simulations, batch_size),
+                                     AlphaZero(teacher, simulations, batch_size), num_games, max_moves)
+    return {
+        "teacher_nodes_per_second": teacher_speed,
+        "student_nodes_per_second": student_speed,
+        "speedup": student_speed / teacher_speed,
+        "top1_match_rate": parity["top1_match_rate"],
+        "max_value_error": parity["max_value_error"],
+        "student_wins": wins,
+        "draws": draws,
+        "student_losses": losses,
+        "student_score": (wins + 0.5 * draws) / max(num_games, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Distill a trained AZNet into a smaller student network")
+    parser.add_argument("replay_dir", help="replay directory (replay.py) with the training positions")
+    parser.add_argument("--teacher", default=None, help="teacher AZNet checkpoint (random weights if omitted)")
+    parser.add_argument("--channels", type=int, default=64, help="student trunk width")
+    parser.add_argument("--blocks", type=int, default=3, help="student residual blocks")
+    parser.add_argument("--head-channels", type=int, default=4,
+                        help="student policy head width (p_fc has 90x this many inputs and dominates the size)")
+    parser.add_argument("--compact", action="store_true", help="student with the compact policy head")
+    parser.add_argument("--steps", type=int, default=5000)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--lr", type=float, default=0.01)
+    parser.add_argument("--workers", type=int, default=2, help="DataLoader worker processes")
+    parser.add_argument("--outcome-weight", type=float, default=0.0,
+                        help="weight of the game outcome in the value target (the rest is the teacher's value)")
+    parser.add_argument("--checkpoint-dir", default="distill_checkpoints")
+    parser.add_argument("--checkpoint-every", type=int, default=1000)
+    parser.add_argument("--log-every", type=int, default=100)
+    parser.add_argument("--output", default="aznet_small.pth", help="where to save the student state dict")
+    parser.add_argument("--simulations", type=int, default=100, help="teacher simulations per move in the report")
+    parser.add_argument("--student-simulations", type=int, default=400)
+    parser.add_argument("--eval-games", type=int, default=10, help="student vs teacher games (0 skips the report)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    teacher = load_model(args.teacher) if args.teacher else AZNet().eval()
+    student = AZNet(args.compact, args.channels, args.blocks, args.head_channels)
+    student, _ = train(args.replay_dir, args.steps, args.batch_size, args.lr, num_workers=args.workers,
+                       checkpoint_dir=args.checkpoint_dir, checkpoint_every=args.checkpoint_every,
+                       log_every=args.log_every, seed=args.seed, model=student, teacher=teacher,
+                       outcome_weight=args.outcome_weight)
+    torch.save(student.state_dict(), args.output)
+    student_parameters = sum(p.numel() for p in student.parameters())
+    teacher_parameters = sum(p.numel() for p in teacher.parameters())
+    print(f"Saved {args.output} ({student_parameters / 1e6:.1f}M parameters, teacher {teacher_parameters / 1e6:.1f}M, "
+          f"{teacher_parameters / student_parameters:.1f}x smaller)")
+
+    if args.eval_games:
+        report = tradeoff_report(teacher, student, args.simulations, args.student_simulations,
+                                 num_games=args.eval_games)
+        for name, value in report.items():
+            print(f"{name}: {value:.3f}" if isinstance(value, float) else f"{name}: {value}")
+
+
+if __name__ == "__main__":
+    main()
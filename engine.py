@@ -0,0 +1,444 @@
+#EE6892 Reinforcement Learning
+#Chinese Chess (Xiangqi) UCCI Engine Module
+
+# A text protocol front end so GUIs, match runners and other programs can play against the agent
+# The protocol is UCCI (the Xiangqi counterpart of UCI), spoken over stdin/stdout or over a local TCP socket
+# where every connection is a game of its own
+
+# Many games at once on one model:
+# The sessions (one per connection) live on an asyncio event loop, which only reads commands and writes replies
+# The search itself is synchronous Python, so every "go" runs AlphaZero.get_move_probabilities in a thread pool
+# All the agents share one BatchedEvaluator: their leaf evaluations are queued and a single evaluation thread runs
+# the network on whatever has arrived from all games (up to max_batch states, waiting at most max_wait),
+# the same dynamic batching as the self-play inference server (selfplay.py) but inside one process
+# The forward pass releases the GIL, so the other games keep selecting leaves while the network runs
+
+# Supported commands (anything else is ignored, as the protocol asks):
+# ucci                                     -> id / option lines, then ucciok
+# isready                                  -> readyok
+# setoption <name> <value>                 (also "setoption name <name> value <value>"), options listed by ucci
+# position {fen <fen> | startpos} [moves <move> ...]
+# go [ponder | draw] [infinite | nodes <n> | depth <n> | movetime <ms> | time <ms> [movestogo <n>] [increment <ms>]]
+#                                          -> info line, then bestmove <move> (nobestmove if there is none)
+# stop                                     ends the running search, which still answers bestmove
+# quit                                     -> bye
+# Moves use UCCI coordinates: file a-i from Red's left, rank 0-9 from Red's side, e.g. h2e2
+# Times are in milliseconds; depth is accepted but ignored since the search has no fixed depth
+# The info score is the search's value for the side to move in thousandths (+1000 a sure win, -1000 a sure loss)
+
+# A position command that extends the previous one by the moves played since keeps the agent's search tree
+# (AlphaZero.update_with_move), anything else starts a fresh tree; every game also has its own EvaluationCache
+# The engine plays by the full rules: it searches legal moves only (AlphaZero legal_moves) and rejects position
+# commands with a move that leaves the own king in check or facing the other king
+
+# Usage:
+# python engine.py --model aznet_chinese_chess.pth                      (one game over stdin/stdout)
+# python engine.py --model aznet_chinese_chess.pth --port 7000 --games 32 (one game per TCP connection)
+
+import argparse
+import asyncio
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+
+from alphazero import AlphaZero
+from board import START_FEN, fen_to_position, position_to_state
+from cache import EvaluationCache
+from evaluators import LogitsEvaluator
+from mcts import MCTSTree
+from moves import get_legal_actions, move_to_action_index, action_index_to_move
+
+
+ENGINE_NAME = "E6892 AlphaZero"
+ENGINE_AUTHOR = "EE6892"
+
+UCCI_FILES = "abcdefghi"
+
+
+# UCCI move notation: file letter and rank digit of the source, then of the destination
+# Rank 0 is Red's back rank (row 9 of the board), rank 9 is Black's (row 0)
+
+def move_to_ucci(move):
+    i1, j1, i2, j2 = move
+    return f"{UCCI_FILES[j1]}{9 - i1}{UCCI_FILES[j2]}{9 - i2}"
+
+def ucci_to_move(text):
+    if len(text) != 4 or text[0] not in UCCI_FILES or text[2] not in UCCI_FILES \
+            or not text[1].isdigit() or not text[3].isdigit():
+        raise ValueError(f"Not a UCCI move: {text}")
+    return (9 - int(text[1]), UCCI_FILES.index(text[0]), 9 - int(text[3]), UCCI_FILES.index(text[2]))
+
+
+# Thread-safe evaluator shared by the searches of all games
+# predict_batch() queues the states of one search round and blocks until the evaluation thread has answered them
+# The evaluation thread takes the first waiting request, keeps collecting requests for up to max_wait seconds or until
+# max_batch states are waiting, and runs the wrapped evaluator (any LogitsEvaluator) once on all of them
+
+class BatchedEvaluator(LogitsEvaluator):
+    def __init__(self, evaluator, max_batch=256, max_wait=0.001):
+        self.evaluator = evaluator
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.requests = queue.Queue()
+        self.forward_passes = 0
+        self.evaluated = 0
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+
+    def predict_batch(self, states):
+        future = Future()
+        self.requests.put((states, future))
+        return future.result()
+
+    # Stops the evaluation thread once the requests queued so far are answered
+    def close(self):
+        self.requests.put(None)
+        self.thread.join()
+
+    @property
+    def mean_batch(self):
+        return self.evaluated / self.forward_passes if self.forward_passes else 0.0
+
+    def _serve(self):
+        while True:
+            request = self.requests.get()
+            if request is None:
+                return
+            batch = [request]
+            total = len(request[0])
+            deadline = time.perf_counter() + self.max_wait
+            while total < self.max_batch:
+                timeout = deadline - time.perf_counter()
+                try:
+                    request = self.requests.get(timeout=timeout) if timeout > 0 else self.requests.get_nowait()
+                except queue.Empty:
+                    break
+                if request is None:
+                    # Answer this batch first, then stop
+                    self.requests.put(None)
+                    break
+                batch.append(request)
+                total += len(request[0])
+
+            try:
+                policy_logits, values = self.evaluator.predict_batch([state for states, _ in batch for state in states])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            offset = 0
+            for states, future in batch:
+                n = len(states)
+                future.set_result((policy_logits[offset:offset + n], values[offset:offset + n]))
+                offset += n
+            self.forward_passes += 1
+            self.evaluated += total
+
+
+# Search budget of one "go" command: (num_simulations, time_limit, node_limit) for the agent
+# "nodes" counts simulations (root visits), the same nodes the info line reports, not the tree nodes of node_limit
+# A clock ("time") is spread over movestogo moves (30 if not given) plus the increment, never more than 80% of it
+def search_budget(params, default_simulations):
+    if "infinite" in params or "ponder" in params:
+        return None, float("inf"), None
+    if "nodes" in params:
+        return max(int(params["nodes"]), 1), None, None
+    if "movetime" in params:
+        return None, params["movetime"] / 1000, None
+    if "time" in params:
+        clock = params["time"]
+        moves_to_go = max(params.get("movestogo", 30), 1)
+        budget = min(clock / moves_to_go + params.get("increment", 0), 0.8 * clock)
+        return None, max(budget, 0) / 1000, None
+    return default_simulations, None, None
+
+
+# Parses the arguments of "go" into a dict: flags map to True, the other keywords to their (numeric) value
+def parse_go(tokens):
+    params = {}
+    k = 0
+    while k < len(tokens):
+        token = tokens[k]
+        if token in ("infinite", "ponder", "draw"):
+            params[token] = True
+        elif k + 1 < len(tokens):
+            try:
+                params[token] = float(tokens[k + 1])
+            except ValueError:
+                pass
+            k += 1
+        k += 1
+    return params
+
+
+# One game: the current position, the agent that searches it and the protocol state
+# write(line) sends one reply line to whoever drives this game
+
+class EngineSession:
+    def __init__(self, engine, write):
+        self.engine = engine
+        self.write = write
+        self.agent = engine.new_agent()
+        self.num_simulations = engine.num_simulations
+        self.base_fen = START_FEN
+        self.moves = []
+        self.position = fen_to_position(START_FEN)
+        self.search = None
+
+    # Handles one command line; returns False once the session is over
+    async def handle(self, line):
+        tokens = line.split()
+        if not tokens:
+            return True
+        command, args = tokens[0], tokens[1:]
+        if command == "ucci":
+            self.write(f"id name {ENGINE_NAME}")
+            self.write(f"id author {ENGINE_AUTHOR}")
+            self.write(f"option simulations type spin min 1 max 1000000 default {self.num_simulations}")
+            self.write(f"option batchsize type spin min 1 max 256 default {self.agent.batch_size}")
+            self.write("ucciok")
+        elif command == "isready":
+            self.write("readyok")
+        elif command == "setoption":
+            self.set_option(args)
+        elif command == "position":
+            if self.search is not None:
+                self.write("info string busy, position ignored")
+            else:
+                self.set_position(args)
+        elif command == "go":
+            if self.search is not None:
+                self.write("info string busy, go ignored")
+            else:
+                agent = self.agent
+                agent.num_simulations, agent.time_limit, agent.node_limit = search_budget(parse_go(args),
+                                                                                          self.num_simulations)
+                self.search = asyncio.ensure_future(self.go())
+        elif command == "stop":
+            self.stop()
+        elif command in ("quit", "bye"):
+            self.stop()
+            if self.search is not None:
+                await self.search
+            self.write("bye")
+            return False
+        return True
+
+    def set_option(self, args):
+        if args and args[0] == "name":
+            args = [token for token in args[1:] if token != "value"]
+        if len(args) < 2:
+            return
+        name, value = args[0].lower(), args[1]
+        try:
+            if name == "simulations":
+                self.num_simulations = max(int(value), 1)
+            elif name == "batchsize":
+                self.agent.batch_size = max(int(value), 1)
+        except ValueError:
+            self.write(f"info string bad value for {name}: {value}")
+
+    def set_position(self, args):
+        if not args:
+            return
+        if args[0] == "startpos":
+            fen, rest = START_FEN, args[1:]
+        elif args[0] == "fen":
+            end = args.index("moves") if "moves" in args else len(args)
+            fen, rest = " ".join(args[1:end]), args[end:]
+        else:
+            self.write(f"info string unknown position type {args[0]}")
+            return
+        try:
+            position = fen_to_position(fen)
+            moves = [ucci_to_move(text) for text in rest[1:]] if rest and rest[0] == "moves" else []
+        except ValueError as e:
+            self.write(f"info string {e}")
+            return
+        for move in moves:
+            if move_to_action_index(move) not in get_legal_actions(position):
+                self.write(f"info string illegal move {move_to_ucci(move)}")
+                return
+            position.make_move(move)
+
+        # Keep the search tree when the game simply went on from the previous position
+        if fen == self.base_fen and moves[:len(self.moves)] == self.moves:
+            for move in moves[len(self.moves):]:
+                self.agent.update_with_move(move)
+        else:
+            self.agent.reset()
+        self.base_fen, self.moves, self.position = fen, moves, position
+
+    async def go(self):
+        agent = self.agent
+        reused = agent.tree is not None and agent.root_position == self.position
+        visits_before = int(agent.tree.visit_count[MCTSTree.ROOT]) if reused else 0
+        start = time.perf_counter()
+        action = None
+        try:
+            action_probs = await self.engine.search(agent, position_to_state(self.position))
+            if action_probs is not None:
+                action = AlphaZero.sample_action(action_probs)
+                self.write_info(agent.tree, action, visits_before, time.perf_counter() - start)
+        except Exception as e:
+            self.write(f"info string search failed: {e}")
+        finally:
+            self.search = None
+            # Always answer the go command, whatever happened to the search
+            if action is None:
+                self.write("nobestmove")
+            else:
+                self.write(f"bestmove {move_to_ucci(action_index_to_move(action))}")
+
+    # Search info of the chosen action; skipped when the root has no child for it (forced moves are not searched)
+    def write_info(self, tree, action, visits_before, elapsed):
+        if tree is None:
+            return
+        children = tree.children(MCTSTree.ROOT)
+        matches = np.flatnonzero(tree.action[children] == action)
+        if not len(matches):
+            return
+        nodes = int(tree.visit_count[MCTSTree.ROOT]) - visits_before
+        score = int(round(1000 * tree.value(children[matches[0]])))
+        self.write(f"info time {int(elapsed * 1000)} nodes {nodes} nps {int(nodes / max(elapsed, 1e-9))} "
+                   f"score {score}")
+
+    # Makes a running search stop at its next round; it still answers bestmove
+    def stop(self):
+        if self.search is not None:
+            self.agent.time_limit = 0
+
+
+# The engine process: the shared evaluator, the search threads and the front ends
+# max_games bounds how many searches run at the same time (further games wait for a free thread)
+
+class Engine:
+    def __init__(self, evaluator, num_simulations=400, batch_size=8, max_games=32, cache_entries=100_000):
+        self.evaluator = evaluator
+        self.num_simulations = num_simulations
+        self.batch_size = batch_size
+        self.cache_entries = cache_entries
+        self.executor = ThreadPoolExecutor(max_workers=max_games, thread_name_prefix="search")
+        self.sessions = 0
+
+    # Searches stop early once the best move is decided, which saves clock time and batch slots for the other games
+    def new_agent(self):
+        return AlphaZero(self.evaluator, self.num_simulations, self.batch_size,
+                         cache=EvaluationCache(self.cache_entries), early_stop=True, legal_moves=True)
+
+    async def search(self, agent, state):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, agent.get_move_probabilities, state)
+
+    # Runs one session on a stream of command lines (an async iterator of str)
+    async def run_session(self, lines, write):
+        self.sessions += 1
+        session = EngineSession(self, write)
+        try:
+            async for line in lines:
+                if not await session.handle(line):
+                    return
+            # Input closed: let a running search finish quietly
+            session.stop()
+            if session.search is not None:
+                await session.search
+        finally:
+            self.sessions -= 1
+
+    # One game over stdin/stdout (stdin is read by a helper thread so any kind of stdin works)
+    async def serve_stdio(self):
+        loop = asyncio.get_running_loop()
+
+        async def lines():
+            while True:
+                line = await loop.run_in_executor(None, sys.stdin.readline)
+                if not line:
+                    return
+                yield line
+
+        def write(line):
+            sys.stdout.write(line + "\n")
+            sys.stdout.flush()
+
+        await self.run_session(lines(), write)
+
+    # One game per TCP connection, until the process is stopped
+    async def serve_tcp(self, host="127.0.0.1", port=7000):
+        async def handle_connection(reader, writer):
+            async def lines():
+                while True:
+                    line = await reader.readline()
+                    if not line:
+                        return
+                    yield line.decode(errors="replace")
+
+            def write(line):
+                writer.write((line + "\n").encode())
+
+            try:
+                await self.run_session(lines(), write)
+                await writer.drain()
+            except ConnectionError:
+                pass
+            finally:
+                writer.close()
+
+        server = await asyncio.start_server(handle_connection, host, port)
+        print(f"Listening on {host}:{port}", file=sys.stderr)
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.evaluator.close()
+
+
+def main():
+    from aznet import AZNet, build_inference_model, load_model
+    from evaluators import OnnxEvaluator, TorchEvaluator
+
+    parser = argparse.ArgumentParser(description="UCCI engine serving one or many games from one model")
+    parser.add_argument("--model", default=None, help="AZNet checkpoint (random weights if omitted)")
+    parser.add_argument("--onnx", default=None, help="evaluate with ONNX Runtime on this exported model instead")
+    parser.add_argument("--quantize", action="store_true", help="INT8 dynamic quantization of the linear layers")
+    parser.add_argument("--simulations", type=int, default=400, help="simulations per move without a clock")
+    parser.add_argument("--batch-size", type=int, default=8, help="leaves per search round of one game")
+    parser.add_argument("--max-batch", type=int, default=256, help="largest batch of the shared evaluator")
+    parser.add_argument("--max-wait", type=float, default=0.001, help="seconds the evaluator waits to fill a batch")
+    parser.add_argument("--games", type=int, default=32, help="games searched at the same time")
+    parser.add_argument("--threads", type=int, default=None, help="torch threads")
+    parser.add_argument("--port", type=int, default=None, help="serve games over TCP instead of stdin/stdout")
+    parser.add_argument("--host", default="127.0.0.1")
+    args = parser.parse_args()
+
+    if args.onnx:
+        backend = OnnxEvaluator(args.onnx, args.threads)
+    else:
+        import torch
+
+        if args.threads:
+            torch.set_num_threads(args.threads)
+        model = load_model(args.model) if args.model else AZNet().eval()
+        backend = TorchEvaluator(build_inference_model(model, quantize=args.quantize))
+
+    engine = Engine(BatchedEvaluator(backend, args.max_batch, args.max_wait), args.simulations, args.batch_size,
+                    args.games)
+    try:
+        if args.port:
+            asyncio.run(engine.serve_tcp(args.host, args.port))
+        else:
+            asyncio.run(engine.serve_stdio())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        engine.close()
+        print(f"{engine.evaluator.evaluated} evaluations in {engine.evaluator.forward_passes} forward passes "
+              f"(mean batch {engine.evaluator.mean_batch:.1f})", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+#EE6892 Reinforcement Learning
+#Chinese Chess (Xiangqi) Evaluator Module
+
+# The search only needs one thing from a neural network: for a batch of leaf positions, the prior of every legal move
+# and a value for the side to move
+# Evaluator is that interface, and AlphaZero talks to the network only through it, so the backend can be swapped:
+
+# TorchEvaluator: a PyTorch model (eager AZNet or an aznet.build_inference_model build), the default of AlphaZero
+# OnnxEvaluator: an AZNet exported with aznet.export_onnx and run by ONNX Runtime on the CPU
+# CachedEvaluator: any evaluator behind an EvaluationCache (cache.py), only cache misses reach the wrapped evaluator
+# FakeEvaluator: deterministic uniform priors and key-derived values without a network, for tests and for measuring
+#                the cost of the search itself
+
+# A single search caches more cheaply with AlphaZero(cache=...), where cache hits skip the evaluation round
+# altogether; CachedEvaluator is for a cache in front of an evaluator that several searches share (e.g. the engine's
+# BatchedEvaluator, or every game of one process)
+
+# Network evaluators derive from LogitsEvaluator and only implement predict_batch(states) -> (policy logits, values);
+# the legal priors are the softmax over the legal moves' logits (in either policy head layout, see moves.policy_columns)
+
+import threading
+
+import numpy as np
+
+from board import position_to_state
+from cache import EvaluationCache, LEGAL_MOVES_KEY
+from moves import policy_columns
+
+
+# Masked softmax: priors for the legal actions computed from their logits only
+# (equal to the full softmax restricted to the legal actions and renormalized)
+def legal_priors(policy_logits, legal_actions):
+    legal_logits = policy_logits[policy_columns(legal_actions, len(policy_logits))]
+    priors = np.exp(legal_logits - legal_logits.max())
+    return priors / np.sum(priors)
+
+
+# Network input planes of a position (the in-sync planes when the position tracks them)
+def position_planes(position):
+    return position.planes if position.planes is not None else position_to_state(position)
+
+
+class Evaluator:
+    def evaluate(self, positions, legal_actions):
+        """
+        Evaluate a batch of positions.
+
+        Args:
+            positions: A list of board.Position objects.
+            legal_actions: For every position, its legal moves as an int array of action indices.
+
+        Returns:
+            priors: A list with one array of priors per position, aligned with its legal_actions.
+            values: A (K,) array of value estimates for the side to move.
+        """
+        raise NotImplementedError
+
+
+class LogitsEvaluator(Evaluator):
+    # (K, num_actions) policy logits and (K,) values for a list of 15x10x9 states
+    def predict_batch(self, states):
+        raise NotImplementedError
+
+    def evaluate(self, positions, legal_actions):
+        policy_logits, values = self.predict_batch([position_planes(position) for position in positions])
+        return [legal_priors(logits, actions) for logits, actions in zip(policy_logits, legal_actions)], values
+
+
+class TorchEvaluator(LogitsEvaluator):
+    def __init__(self, model):
+        self.model = model
+
+    def predict_batch(self, states):
+        import torch
+
+        state_tensor = torch.from_numpy(np.stack(states).astype(np.float32, copy=False))
+        with torch.inference_mode():
+            policy_logits, values = self.model(state_tensor)
+        return policy_logits.numpy(), values.reshape(-1).numpy()
+
+
+# ONNX Runtime is an optional dependency, imported only when an OnnxEvaluator is created
+class OnnxEvaluator(LogitsEvaluator):
+    def __init__(self, model_path, num_threads=None):
+        try:
+            import onnxruntime
+        except ImportError as e:
+            raise ImportError("OnnxEvaluator needs onnxruntime (pip install onnxruntime)") from e
+
+        options = onnxruntime.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+
+    def predict_batch(self, states):
+        policy_logits, values = self.session.run(None, {"states": np.stack(states).astype(np.float32, copy=False)})
+        return policy_logits, values.reshape(-1)
+
+
+# Cache in front of another evaluator, keyed by position Zobrist key like AlphaZero(cache=...)
+# legal_moves must match the agents using it (priors in get_legal_actions order get LEGAL_MOVES_KEY, see cache.py),
+# so the same EvaluationCache can also be shared with AlphaZero(cache=...) agents
+# Cache lookups are locked, since searches in several threads may share one CachedEvaluator
+class CachedEvaluator(Evaluator):
+    def __init__(self, evaluator, cache=None, legal_moves=False):
+        self.evaluator = evaluator
+        self.cache = cache if cache is not None else EvaluationCache()
+        self.key_mask = LEGAL_MOVES_KEY if legal_moves else 0
+        self.lock = threading.Lock()
+
+    def evaluate(self, positions, legal_actions):
+        priors = [None] * len(positions)
+        values = np.zeros(len(positions), dtype=np.float32)
+        misses = []
+        with self.lock:
+            for k, position in enumerate(positions):
+                cached = self.cache.get(position.key ^ self.key_mask)
+                if cached is None:
+                    misses.append(k)
+                else:
+                    priors[k], values[k] = cached
+        if misses:
+            miss_priors, miss_values = self.evaluator.evaluate([positions[k] for k in misses],
+                                                               [legal_actions[k] for k in misses])
+            with self.lock:
+                for k, prior, value in zip(misses, miss_priors, miss_values):
+                    priors[k], values[k] = prior, value
+                    self.cache.put(positions[k].key ^ self.key_mask, prior, float(value))
+        return priors, values
+
+    def close(self):
+        if hasattr(self.evaluator, "close"):
+            self.evaluator.close()
+
+
+# Uniform priors and a value in [-value_scale, value_scale] derived from the Zobrist key,
+# so the same position always gets the same evaluation
+class FakeEvaluator(Evaluator):
+    def __init__(self, value_scale=0.1, seed=0):
+        self.value_scale = value_scale
+        self.seed = seed
+        self.evaluated = 0
+
+    def evaluate(self, positions, legal_actions):
+        self.evaluated += len(positions)
+        priors = [np.full(len(actions), 1.0 / len(actions)) for actions in legal_actions]
+        values = np.array([((position.key ^ self.seed) % 2001 - 1000) / 1000 * self.value_scale
+                           for position in positions], dtype=np.float32)
+        return priors, values
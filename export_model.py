@@ -0,0 +1,131 @@
+#EE6892 Reinforcement Learning
+#Chinese Chess (Xiangqi) Inference Export Module
+
+# Builds the inference version of AZNet (see aznet.build_inference_model), checks it against the eager model
+# and reports the latency of both for the batch sizes MCTS actually produces
+
+# Parity check: both models run on states from random playouts, and we report the largest absolute difference of the
+# policy logits and values, plus how often the top-1 move among the legal moves is the same
+# Latency: median wall-clock time of a forward pass under torch.inference_mode() per batch size
+# --onnx also exports the model for ONNX Runtime (aznet.export_onnx) and checks and times it the same way
+
+# Usage:
+# python export_model.py --model aznet_chinese_chess.pth --channels-last --backend script --output aznet_inference.pt
+# python export_model.py --model aznet_chinese_chess.pth --onnx aznet.onnx
+
+import argparse
+import time
+
+import numpy as np
+import torch
+
+from aznet import AZNet, load_model, build_inference_model, export_onnx
+from board import position_to_state
+from moves import NUM_COMPACT_ACTIONS, compact_actions, get_all_actions, policy_columns
+from utils import random_positions
+
+
+# Forward pass of a model, or of an evaluators.LogitsEvaluator through its predict_batch
+def _forward(model, states):
+    if hasattr(model, "predict_batch"):
+        return [torch.from_numpy(np.asarray(out)) for out in model.predict_batch(list(states.numpy()))]
+    return model(states)
+
+
+def parity_check(reference, candidate, num_positions=256, seed=0):
+    positions = random_positions(num_positions, seed)
+    states = torch.from_numpy(np.stack([position_to_state(position) for position in positions]))
+    with torch.inference_mode():
+        ref_logits, ref_values = _forward(reference, states)
+        new_logits, new_values = _forward(candidate, states)
+    # An 8100-way model checked against its compact conversion is compared on the compact columns
+    if ref_logits.shape[1] != new_logits.shape[1]:
+        columns = torch.from_numpy(compact_actions)
+        ref_logits, new_logits = [logits if logits.shape[1] == NUM_COMPACT_ACTIONS else logits[:, columns]
+                                  for logits in (ref_logits, new_logits)]
+
+    top1_match = 0
+    for b, position in enumerate(positions):
+        actions = get_all_actions(position)
+        ref_best = ref_logits[b, policy_columns(actions, ref_logits.shape[1])].argmax()
+        new_best = new_logits[b, policy_columns(actions, new_logits.shape[1])].argmax()
+        top1_match += int(actions[ref_best] == actions[new_best])
+    return {
+        "positions": num_positions,
+        "max_logit_error": (ref_logits - new_logits).abs().max().item(),
+        "max_value_error": (ref_values - new_values).abs().max().item(),
+        "top1_match_rate": top1_match / num_positions,
+    }
+
+
+# Median forward latency in milliseconds for each batch size
+# (model can also be an evaluators.LogitsEvaluator, whose predict_batch is timed instead)
+def measure_latency(model, batch_sizes=(1, 2, 4, 8, 16, 32, 64), repeats=20, warmup=3):
+    results = {}
+    for batch_size in batch_sizes:
+        states = torch.zeros(batch_size, 15, 10, 9)
+        states[:, 14] = 1
+        timings = []
+        with torch.inference_mode():
+            for k in range(warmup + repeats):
+                start = time.perf_counter()
+                _forward(model, states)
+                if k >= warmup:
+                    timings.append(time.perf_counter() - start)
+        results[batch_size] = float(np.median(timings) * 1000)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build, check and time the inference version of AZNet")
+    parser.add_argument("--model", default=None, help="AZNet checkpoint (random weights if omitted)")
+    parser.add_argument("--channels-last", action="store_true")
+    parser.add_argument("--backend", default="script", choices=["script", "compile", "eager"])
+    parser.add_argument("--output", default=None, help="save the TorchScript build here (script backend only)")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--onnx", default=None, help="also export for ONNX Runtime to this path, check and time it")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    eager = load_model(args.model) if args.model else AZNet().eval()
+    backend = None if args.backend == "eager" else args.backend
+    inference = build_inference_model(eager, args.channels_last, backend)
+
+    parity = parity_check(eager, inference)
+    print(f"Parity on {parity['positions']} positions: max logit error {parity['max_logit_error']:.2e}, "
+          f"max value error {parity['max_value_error']:.2e}, top-1 match {parity['top1_match_rate']:.1%}")
+
+    eager_latency = measure_latency(eager, args.batch_sizes, args.repeats)
+    inference_latency = measure_latency(inference, args.batch_sizes, args.repeats)
+    print(f"{'batch':>6} {'eager ms':>10} {'inference ms':>13} {'speedup':>8} {'inference pos/s':>16}")
+    for batch_size in args.batch_sizes:
+        eager_ms, inference_ms = eager_latency[batch_size], inference_latency[batch_size]
+        print(f"{batch_size:>6} {eager_ms:>10.2f} {inference_ms:>13.2f} {eager_ms / inference_ms:>7.2f}x "
+              f"{batch_size / inference_ms * 1000:>16.0f}")
+
+    if args.onnx:
+        from evaluators import OnnxEvaluator
+
+        export_onnx(eager, args.onnx)
+        onnx = OnnxEvaluator(args.onnx, args.threads)
+        parity = parity_check(eager, onnx)
+        print(f"ONNX parity: max logit error {parity['max_logit_error']:.2e}, "
+              f"max value error {parity['max_value_error']:.2e}, top-1 match {parity['top1_match_rate']:.1%}")
+        onnx_latency = measure_latency(onnx, args.batch_sizes, args.repeats)
+        for batch_size in args.batch_sizes:
+            print(f"{batch_size:>6} onnx {onnx_latency[batch_size]:>10.2f} ms "
+                  f"({eager_latency[batch_size] / onnx_latency[batch_size]:.2f}x eager)")
+        print(f"Saved {args.onnx}")
+
+    if args.output:
+        if args.backend != "script":
+            raise SystemExit("--output needs the script backend")
+        torch.jit.save(inference, args.output)
+        print(f"Saved {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,8 +7,11 @@
 # Connection to its parent
 # The move that led to it
 import math
-from board import state_to_board, make_move
-from moves import get_all_moves, move_to_action_index
+
+import numpy as np
+
+from board import make_move
+from moves import action_index_to_move
 
 # Represents a node in the MCTS tree
 # state is the current game state (15x10x9) tensor
@@ -18,15 +21,25 @@ from moves import get_all_moves, move_to_action_index
 # We also check the visit_count to use in later stages
 # Value_sum represents the sum of simulation values 
 # P(s,a): prior probability from policy net
+
+# Children are created lazily: expand() only records the move and prior of each child
+# The child's state tensor is built from its parent the first time something reads node.state,
+# so unvisited children (most of them) never allocate a 15x10x9 array
 class MCTSNode:
-    def __init__(self, state, parent=None, move=None):
-        self.state = state
+    def __init__(self, state=None, parent=None, move=None, prior=0):
+        self._state = state
         self.parent = parent
         self.move = move
         self.children = {}
         self.visit_count = 0
         self.value_sum = 0
-        self.prior = 0
+        self.prior = prior
+    
+    @property
+    def state(self):
+        if self._state is None and self.parent is not None:
+            self._state = make_move(self.parent.state, self.move)
+        return self._state
     
     # Average value (Q) of this node based on rollouts
     def value(self):
@@ -62,18 +75,12 @@ class MCTSNode:
             
             if move not in self.children:
                 # Only add a child node if this move hasn't been explored yet
-                
-                # Apply the move to the current game state to get the new state
-                child_state = make_move(self.state, move)
-                # Create a new child node for that resulting state
+                # The child only stores its move and prior, its state is built on first use
                 self.children[move] = MCTSNode(
-                    child_state,       # the new game state
                     parent=self,       # link back to the current node (for backpropagation)
-                    move=move          # the move that led to this child
+                    move=move,         # the move that led to this child
+                    prior=prior        # the policy prior (from neural net) to guide future selection
                 )
-                    
-                # Assign the policy prior (from neural net) to guide future selection
-                self.children[move].prior = prior
     
     def update(self, value):
         # This method is called during backpropagation.
@@ -81,4 +88,166 @@ class MCTSNode:
         # we use it to update this node's statistics.
             
         self.visit_count += 1       # Increase the number of times this node was visited (N(s))
-        self.value_sum += value     # Accumulate the simulation result (to later compute average Q(s))
\ No newline at end of file
+        self.value_sum += value     # Accumulate the simulation result (to later compute average Q(s))
+
+# Struct-of-arrays search tree
+# MCTSNode keeps one Python object (with its own __dict__ and children dict) per node, which is convenient for analysis
+# but every selection step loops over the children in Python
+# MCTSTree stores the statistics of every node in flat NumPy arrays indexed by node id:
+# visit_count (N), value_sum (W), prior (P), action, parent, first_child and num_children
+# expand() allocates all children of a node as one contiguous block, so the N, W and P of a node's children are
+# array slices and select_child() is one vectorized argmax over their UCB scores
+# Node 0 is always the root, action[node] is the action index (src * 90 + dst) of the move that led to the node
+# to_node() converts (part of) the tree back into MCTSNode objects for analysis code
+
+class MCTSTree:
+    ROOT = 0
+    ARRAYS = ("visit_count", "value_sum", "prior", "action", "parent", "first_child", "num_children")
+
+    def __init__(self, capacity=4096):
+        self.size = 1
+        self.visit_count = np.zeros(capacity, dtype=np.int32)
+        self.value_sum = np.zeros(capacity, dtype=np.float64)
+        self.prior = np.zeros(capacity, dtype=np.float32)
+        self.action = np.zeros(capacity, dtype=np.int16)
+        self.parent = np.full(capacity, -1, dtype=np.int32)
+        self.first_child = np.zeros(capacity, dtype=np.int32)
+        self.num_children = np.zeros(capacity, dtype=np.int32)
+
+    # Double the arrays until they can hold `needed` nodes
+    def _grow(self, needed):
+        capacity = len(self.visit_count)
+        while capacity < needed:
+            capacity *= 2
+        for name in self.ARRAYS:
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    # Bytes held by the node arrays (allocated capacity, the first `size` nodes are in use)
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in self.ARRAYS)
+
+    @property
+    def capacity(self):
+        return len(self.visit_count)
+
+    def is_leaf(self, node):
+        return self.num_children[node] == 0
+
+    # The (i1, j1, i2, j2) move that led to a node
+    def move(self, node):
+        return action_index_to_move(int(self.action[node]))
+
+    def children(self, node):
+        start = int(self.first_child[node])
+        return range(start, start + int(self.num_children[node]))
+
+    # Average value (Q) of a node, 0 if unvisited
+    def value(self, node):
+        if self.visit_count[node] == 0:
+            return 0
+        return self.value_sum[node] / self.visit_count[node]
+
+    # Same UCB formula as MCTSNode.select_child, computed for all children at once
+    # Unvisited children have W = 0, so dividing by max(N, 1) gives them the neutral value 0
+    # Returns the node id of the best child
+    def select_child(self, node, c_puct=1.0):
+        start = self.first_child[node]
+        end = start + self.num_children[node]
+        visits = self.visit_count[start:end]
+        q = self.value_sum[start:end] / np.maximum(visits, 1)
+        u = c_puct * self.prior[start:end] * (math.sqrt(self.visit_count[node]) / (1 + visits))
+        return int(start + np.argmax(q + u))
+
+    # Adds one child per legal action (int array of action indices) as a contiguous block of node ids
+    def expand(self, node, priors, actions):
+        if self.num_children[node]:
+            return
+        start = self.size
+        end = start + len(actions)
+        if end > len(self.visit_count):
+            self._grow(end)
+        self.prior[start:end] = priors
+        self.action[start:end] = actions
+        self.parent[start:end] = node
+        self.first_child[node] = start
+        self.num_children[node] = len(actions)
+        self.size = end
+
+    # Backpropagation along a root-to-leaf path of node ids
+    # Like MCTSNode.update in a reversed loop: the leaf receives -value and the sign flips at every level above it
+    def backup(self, search_path, value):
+        path = np.asarray(search_path)
+        depth_from_leaf = np.arange(len(path) - 1, -1, -1)
+        self.visit_count[path] += 1
+        self.value_sum[path] += np.where(depth_from_leaf % 2 == 0, -value, value)
+
+    # Virtual loss for batched search: a path waiting for its network evaluation counts as
+    # `amount` lost visits, so other selections in the same batch are steered away from it
+    def add_virtual_loss(self, search_path, amount):
+        path = np.asarray(search_path)
+        self.visit_count[path] += 1
+        self.value_sum[path] -= amount
+
+    def remove_virtual_loss(self, search_path, amount):
+        path = np.asarray(search_path)
+        self.visit_count[path] -= 1
+        self.value_sum[path] += amount
+
+    # Tree reuse between moves: returns a new, compact MCTSTree whose root is `node`
+    # Only the subtree under `node` is copied (block by block, so children stay contiguous),
+    # everything else is dropped with the old tree
+    def subtree(self, node):
+        count = self._subtree_size(node)
+        capacity = 4096
+        while capacity < count:
+            capacity *= 2
+        tree = MCTSTree(capacity)
+        tree.visit_count[0] = self.visit_count[node]
+        tree.value_sum[0] = self.value_sum[node]
+        stack = [(node, 0)]
+        while stack:
+            old, new = stack.pop()
+            num_children = int(self.num_children[old])
+            if not num_children:
+                continue
+            start = int(self.first_child[old])
+            new_start = tree.size
+            tree.first_child[new] = new_start
+            tree.num_children[new] = num_children
+            tree.visit_count[new_start:new_start + num_children] = self.visit_count[start:start + num_children]
+            tree.value_sum[new_start:new_start + num_children] = self.value_sum[start:start + num_children]
+            tree.prior[new_start:new_start + num_children] = self.prior[start:start + num_children]
+            tree.action[new_start:new_start + num_children] = self.action[start:start + num_children]
+            tree.parent[new_start:new_start + num_children] = new
+            tree.size += num_children
+            stack.extend((start + k, new_start + k) for k in range(num_children))
+        return tree
+
+    def _subtree_size(self, node):
+        size = 1
+        stack = [node]
+        while stack:
+            index = stack.pop()
+            size += int(self.num_children[index])
+            stack.extend(self.children(index))
+        return size
+
+    # Builds an MCTSNode tree mirroring the subtree under `node`
+    # state is the game state of that node, children states are then built lazily as usual
+    def to_node(self, state=None, node=ROOT):
+        root = MCTSNode(state, move=self.move(node) if node != MCTSTree.ROOT else None, prior=float(self.prior[node]))
+        stack = [(node, root)]
+        while stack:
+            index, mcts_node = stack.pop()
+            mcts_node.visit_count = int(self.visit_count[index])
+            mcts_node.value_sum = float(self.value_sum[index])
+            for child in self.children(index):
+                move = self.move(child)
+                child_node = MCTSNode(parent=mcts_node, move=move, prior=float(self.prior[child]))
+                mcts_node.children[move] = child_node
+                stack.append((child, child_node))
+        return root
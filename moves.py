@@ -10,19 +10,25 @@
 # This file contains the scripts for our Xiangqi enviroement with utility functions
 # Move encoders and movement logic for each piece
 
+import numpy as np
+
+from board import EMPTY, KING, ADVISOR, ELEPHANT, HORSE, CHARIOT, CANNON, PAWN
+
 # Board Helper Functions
+# All generators work directly on the compact Position from board.py
+# squares is its 90-entry bytearray of piece codes (square = i * 9 + j) and red is the side to move
 
-# is_red(piece) / is_black(piece) functions determines which side a piece belongs to
-# Red pieces are shown in uppercase and black pieces are shown in lowercase
-# We skip the empty boards by checking if its "." 
+# is_red(code) / is_black(code) functions determines which side a piece belongs to
+# Red pieces are codes 1-7 and black pieces are codes 8-14
+# We skip the empty squares by checking for code 0 (EMPTY)
 
-def is_red(piece):
+def is_red(code):
         
-    return piece.isupper()
+    return 0 < code < 8
 
-def is_black(piece):
+def is_black(code):
         
-    return piece.islower() and piece != '.'
+    return code > 7
 
 # is_in_board function checks if the pieces are in the board (10x9)
 
@@ -34,9 +40,9 @@ def is_in_board(i, j):
 # Red palace: rows 7–9, cols 3–5
 # Black palace: rows 0–2, cols 3–5
 
-def is_in_palace(i, j, color):
+def is_in_palace(i, j, red):
         
-    if color == 'red':
+    if red:
         return 7 <= i <= 9 and 3 <= j <= 5
     else: 
         # black
@@ -44,17 +50,16 @@ def is_in_palace(i, j, color):
 
 # We check if the state is empty 
 
-def is_empty(board, i, j):
+def is_empty(squares, i, j):
         
-    return board[i][j] == '.'
+    return squares[i * 9 + j] == EMPTY
 
 # Returns True if the piece at (i, j) is an enemy
 
-def is_opponent(board, i, j, color):
+def is_opponent(squares, i, j, red):
         
-    return (board[i][j] != '.' and 
-            ((color == 'red' and is_black(board[i][j])) or 
-             (color == 'black' and is_red(board[i][j]))))
+    code = squares[i * 9 + j]
+    return code != EMPTY and (code > 7) == red
 
 # Move format conversions
 # Converts a move (i1, j1, i2, j2) to UCI-style string like "a3-e3"
@@ -107,34 +112,65 @@ def move_to_action_index(move):
         
     return src_pos * 90 + dst_pos
 
+# Lookup tables for the reverse direction
+# action_moves[index] is the move tuple of an action index, action_move_table is the same as an (8100, 4) array
+# so a whole array of action indices can be converted in one fancy-indexing step
+
+action_moves = [(src // 9, src % 9, dst // 9, dst % 9) for src in range(90) for dst in range(90)]
+action_move_table = np.array(action_moves, dtype=np.int64)
+
 def action_index_to_move(index):
         
-    src_pos = index // 90
-    dst_pos = index % 90
-    i1, j1 = src_pos // 9, src_pos % 9
-    i2, j2 = dst_pos // 9, dst_pos % 9
-        
-    return (i1, j1, i2, j2)
+    if np.ndim(index):
+        return action_move_table[index]
+    return action_moves[index]
+
+# Precomputed move tables
+# Everything about a piece's movement that depends only on its type, colour and square (offsets, board bounds,
+# palace membership, river crossing, the horse leg and the elephant eye) is worked out once at import time
+# For every square a table lists the reachable destinations together with the move's action index (src * 90 + dst),
+# and for horses/elephants also the blocking square, so the generators below only look up and test occupancy
+# The generators therefore produce action indices directly, the form used by the search and the policy network
+# (action_moves[action] gives the (i1, j1, i2, j2) tuple back)
+# Tables indexed by colour use table[red][square] (False → black, True → red)
+
+def _action(src, dst):
+    return src * 90 + dst
+
+def _step_table(steps, allowed):
+    table = []
+    for sq in range(90):
+        i, j = sq // 9, sq % 9
+        entries = []
+        for di, dj in steps:
+            ni, nj = i + di, j + dj
+            if is_in_board(ni, nj) and allowed(ni, nj):
+                entries.append((ni * 9 + nj, _action(sq, ni * 9 + nj)))
+        table.append(entries)
+    return table
 
 # Since Xinanqi requires many advanced rules and rulebook to simplfy the architectire
 # We enforced basic rules such as the King moves only one square orthogonally
 # The King must stay inside its palace
 # and The King can only capture opponent pieces or move to empty squares.
 
-# However, in this implementation we have NOT included some advanced rules such as King Face-to-Face Rule
+# The piece generators (and get_all_actions) do NOT enforce the rules that depend on the whole board, i.e.
+# not leaving the own King in check and the King Face-to-Face Rule; get_legal_actions() below filters those out
 # Source : https://www.xqinenglish.com/index.php?Itemid=569&catid=119&id=923%3Athe-rules-of-xiangqi-chinese-chess&lang=en&option=com_content&view=article&
 # "In Xiangqi, if the two Kings are on the same file (same column) and no pieces are between them, then neither King may move into that position" ( King Face-to-Face Rule ) 
 
-def get_king_moves(board, i, j, color):
+king_table = [
+    _step_table([(0, 1), (1, 0), (0, -1), (-1, 0)], lambda i, j, red=red: is_in_palace(i, j, red))
+    for red in (False, True)
+]
+
+def get_king_moves(squares, sq, red):
         
     moves = []
-    directions = [(0, 1), (1, 0), (0, -1), (-1, 0)]
-        
-    for di, dj in directions:
-        ni, nj = i + di, j + dj
-        if (is_in_board(ni, nj) and is_in_palace(ni, nj, color) and 
-            (is_empty(board, ni, nj) or is_opponent(board, ni, nj, color))):
-            moves.append((i, j, ni, nj))
+    for dst, action in king_table[red][sq]:
+        code = squares[dst]
+        if code == EMPTY or (code > 7) == red:
+            moves.append(action)
                 
     return moves
 
@@ -144,47 +180,54 @@ def get_king_moves(board, i, j, color):
 # Can only move diagonally one step
 # It exists only to protect the King and never leaves the 3×3 palace
 
-def get_advisor_moves(board, i, j, color):
+advisor_table = [
+    _step_table([(1, 1), (1, -1), (-1, 1), (-1, -1)], lambda i, j, red=red: is_in_palace(i, j, red))
+    for red in (False, True)
+]
+
+def get_advisor_moves(squares, sq, red):
     moves = []
-    directions = [(1, 1), (1, -1), (-1, 1), (-1, -1)]
-        
-    for di, dj in directions:
-        ni, nj = i + di, j + dj
-        if (is_in_board(ni, nj) and is_in_palace(ni, nj, color) and 
-            (is_empty(board, ni, nj) or is_opponent(board, ni, nj, color))):
-            moves.append((i, j, ni, nj))
+    for dst, action in advisor_table[red][sq]:
+        code = squares[dst]
+        if code == EMPTY or (code > 7) == red:
+            moves.append(action)
                 
     return moves
 
 # The Elephant:
 # Moves exactly two steps diagonally
 # Cannot cross the river
-# Red side: must stay on rows 
-# Black side: must stay on rows 
+# Red side: must stay on rows 5-9
+# Black side: must stay on rows 0-4
 # Can be blocked by a piece at the halfway point 
 
-# Our main condition consists of :
-# is_in_board(ni, nj) corresponds to not go off the 10×9 board
-# Red: ni >= 5	makes sure that stays on Red’s side of the river
-# Black: ni <= 4   makes sure that stays on Red’s side of the river
-# is_empty(ei, ej)	The “elephant eye” must not be blocked so we need to check that
-# is_empty or is_opponent is the destination which must be either empty or an enemy
-
-def get_elephant_moves(board, i, j, color):
+# The table already applies the board edge and the river (Red: ni >= 5, Black: ni <= 4)
+# and stores the "elephant eye" square of every jump
+# At generation time the eye must be empty and the destination must be either empty or an enemy
+
+def _elephant_table(red):
+    table = []
+    for sq in range(90):
+        i, j = sq // 9, sq % 9
+        entries = []
+        # We add 4 diagnonal jumps, each consist of two blocks 
+        for di, dj in [(2, 2), (2, -2), (-2, 2), (-2, -2)]:
+            ni, nj = i + di, j + dj
+            if is_in_board(ni, nj) and ((red and ni >= 5) or (not red and ni <= 4)):
+                # Elephant eye position
+                eye = (i + di // 2) * 9 + (j + dj // 2)
+                entries.append((ni * 9 + nj, eye, _action(sq, ni * 9 + nj)))
+        table.append(entries)
+    return table
+
+elephant_table = [_elephant_table(False), _elephant_table(True)]
+
+def get_elephant_moves(squares, sq, red):
     moves = []
-
-    # We add 4 diagnonal jumps, each consist of two blocks 
-    directions = [(2, 2), (2, -2), (-2, 2), (-2, -2)]
-    for di, dj in directions:
-        ni, nj = i + di, j + dj
-            
-        # Elephant eye position
-        ei, ej = i + di//2, j + dj//2
-        if (is_in_board(ni, nj) and 
-            ((color == 'red' and ni >= 5) or (color == 'black' and ni <= 4)) and 
-            is_empty(board, ei, ej) and 
-            (is_empty(board, ni, nj) or is_opponent(board, ni, nj, color))):
-            moves.append((i, j, ni, nj))
+    for dst, eye, action in elephant_table[red][sq]:
+        code = squares[dst]
+        if squares[eye] == EMPTY and (code == EMPTY or (code > 7) == red):
+            moves.append(action)
                 
     return moves
 
@@ -193,83 +236,85 @@ def get_elephant_moves(board, i, j, color):
 # Can be blocked if the adjacent square ("horse leg") is occupied
 # Does not jump over pieces like a knight in Western chess
 
-# Our main condition consists of:
-# is_in_board(ni, nj) ensures the destination is inside the 10×9 board
-# is_empty or is_opponent: the destination must be either empty or hold an enemy piece
-# is_empty(leg_i, leg_j) checks that the "horse leg" is not blocked
-
-
-def get_horse_moves(board, i, j, color):
+# The table keeps every on-board landing square with its "horse leg"
+# (the square directly adjacent in the first step of movement), which is the same for both colours
+# At generation time the leg must be empty and the destination must be either empty or an enemy
+
+def _horse_table():
+    table = []
+    for sq in range(90):
+        i, j = sq // 9, sq % 9
+        entries = []
+        # 8 L-shaped move options
+        for di, dj in [(2, 1), (2, -1), (-2, 1), (-2, -1),   # Vertical first, then horizontal
+                       (1, 2), (1, -2), (-1, 2), (-1, -2)]:  # Horizontal first, then vertical
+            ni, nj = i + di, j + dj  # Final landing square
+            if is_in_board(ni, nj):
+                if abs(di) == 2:
+                    leg = (i + di // 2) * 9 + j  # Moving vertically, check vertical leg
+                else:
+                    leg = i * 9 + (j + dj // 2)  # Moving horizontally, check horizontal leg
+                entries.append((ni * 9 + nj, leg, _action(sq, ni * 9 + nj)))
+        table.append(entries)
+    return table
+
+horse_table = _horse_table()
+
+def get_horse_moves(squares, sq, red):
     moves = []
-
-    # 8 L-shaped move options
-    steps = [
-        (2, 1), (2, -1), (-2, 1), (-2, -1),  # Vertical first, then horizontal
-        (1, 2), (1, -2), (-1, 2), (-1, -2)   # Horizontal first, then vertical
-    ]
-
-    for di, dj in steps:
-        ni, nj = i + di, j + dj  # Final landing square
-
-        # We have to make sure move is on the board, and target is valid
-        if is_in_board(ni, nj) and (is_empty(board, ni, nj) or is_opponent(board, ni, nj, color)):
-
-            # Then we determine the the "horse leg" square
-            # This is the square directly adjacent in the first step of movement
-                
-            leg_i, leg_j = i, j
-            if abs(di) == 2:
-                    
-                # Moving vertically
-                # check vertical leg
-                leg_i = i + di // 2  
-            else:
-                # Moving horizontally 
-                # check horizontal leg
-                leg_j = j + dj // 2  
-
-            # Ensure the leg is not blocked
-            if is_empty(board, leg_i, leg_j):
-                moves.append((i, j, ni, nj))
+    for dst, leg, action in horse_table[sq]:
+        code = squares[dst]
+        if squares[leg] == EMPTY and (code == EMPTY or (code > 7) == red):
+            moves.append(action)
 
     return moves
 
+# Rays for the sliding pieces
+# rays[sq] holds 4 lists (right, down, left, up), each one the squares from sq to the board edge in order
+# together with the action index, so chariots and cannons just walk them
+
+def _rays():
+    table = []
+    for sq in range(90):
+        i, j = sq // 9, sq % 9
+        directions = []
+        for di, dj in [(0, 1), (1, 0), (0, -1), (-1, 0)]:
+            ray = []
+            ni, nj = i + di, j + dj
+            while is_in_board(ni, nj):
+                ray.append((ni * 9 + nj, _action(sq, ni * 9 + nj)))
+                ni, nj = ni + di, nj + dj
+            directions.append(ray)
+        table.append(directions)
+    return table
+
+rays = _rays()
+
 # The Chariot (车 / 車):
 # Moves exactly like a rook in Western Chess — horizontally or vertically any number of squares
 # It can be blocked by any piece and cannot jump over them
 # Can capture opponent pieces by stopping on their square
 
 # Our main conditions:
-# is_in_board(ni, nj): ensures the move stays within the 10×9 board
-# is_empty: chariot can keep sliding through empty squares
-# is_opponent: can capture an opponent and then stop
+# Each ray already stops at the board edge
+# empty square: chariot can keep sliding through empty squares
+# opponent: can capture an opponent and then stop
 # Otherwise (own piece blocks), we break the direction
 
-def get_chariot_moves(board, i, j, color):
+def get_chariot_moves(squares, sq, red):
     moves = []
 
-    # 4 orthogonal directions: right, down, left, up
-    directions = [(0, 1), (1, 0), (0, -1), (-1, 0)]
-
-    for di, dj in directions:
-        # Try stepping further in that direction, up to the board edge
-        for step in range(1, 10):
-            ni = i + di * step
-            nj = j + dj * step
-
-            # If out of bounds, stop checking in this direction
-            if not is_in_board(ni, nj):
-                break
-
-            if is_empty(board, ni, nj):
+    for ray in rays[sq]:
+        for dst, action in ray:
+            code = squares[dst]
+            if code == EMPTY:
                 # Empty square → legal move, keep going
-                moves.append((i, j, ni, nj))
-            elif is_opponent(board, ni, nj, color):
-                # Can capture opponent piece → legal move, but stop after this
-                moves.append((i, j, ni, nj))
-                break
+                moves.append(action)
             else:
+                # Can capture opponent piece → legal move, but stop after this
                 # Own piece blocks the path → stop here
+                if (code > 7) == red:
+                    moves.append(action)
                 break
 
     return moves
@@ -280,66 +325,30 @@ def get_chariot_moves(board, i, j, color):
 # It cannot jump over more than one piece or capture without a platform in between
 
 # Our main conditions:
-# is_in_board(ni, nj): ensures within the 10×9 board
-# is_empty: allows the cannon to move freely when not capturing
-# Once a blocking piece is found (platform), we begin a second loop:
+# Each ray already stops at the board edge
+# empty square: allows the cannon to move freely when not capturing
+# Once a blocking piece is found (platform), we keep walking the same ray:
 # We search for the next non-empty square — if it's an opponent, it's a legal capture
 
-# The Cannon (炮 / 包):
-# Moves like the chariot (rook) when **not capturing**
-# To **capture**, it must jump exactly **one piece** (any piece) called the "platform"
-# It cannot jump over more than one piece or capture without a platform in between
-
-# Our main conditions:
-# is_in_board(ni, nj): ensures within the 10×9 board
-# is_empty: allows the cannon to move freely when not capturing
-# Once a blocking piece is found (platform), we begin a second loop:
-# We search for the next non-empty square — if it's an opponent, it's a legal capture
-
-def get_cannon_moves(board, i, j, color):
+def get_cannon_moves(squares, sq, red):
     moves = []
 
-    # Cannon moves in straight lines like rook: right, down, left, up
-    directions = [(0, 1), (1, 0), (0, -1), (-1, 0)]
-
-    for di, dj in directions:
-        # Until the first block we can move freely
-        for step in range(1, 10):
-            ni, nj = i + di * step, j + dj * step
-
-            # Stop if move is outside the board
-            if not is_in_board(ni, nj):
-                break
-
-            if is_empty(board, ni, nj):
-                # Cannon moves like a rook when not capturing
-                moves.append((i, j, ni, nj))
-            else:
-                # Found a platform piece
-                # Prepare for capture
-                platform_i, platform_j = ni, nj
-
-                # Find an opponent to capture
-                for capture_step in range(1, 10):
-                    ci = platform_i + di * capture_step
-                    cj = platform_j + dj * capture_step
-
-                    # Break if off board
-                    if not is_in_board(ci, cj):
-                        break
-
-                    # Skip empty squares beyond the platform
-                    if is_empty(board, ci, cj):
-                        continue
-
-                    # First non-empty square beyond platform
-                    if is_opponent(board, ci, cj, color):
-                        moves.append((i, j, ci, cj))
-                            
-                    # Whether it's capturable or not, we stop after the first piece
-                    break
-
-                # Stop further scanning in the current direction after platform
+    for ray in rays[sq]:
+        platform = False
+        for dst, action in ray:
+            code = squares[dst]
+            if not platform:
+                if code == EMPTY:
+                    # Cannon moves like a rook when not capturing
+                    moves.append(action)
+                else:
+                    # Found a platform piece, prepare for capture
+                    platform = True
+            elif code != EMPTY:
+                # First non-empty square beyond platform
+                if (code > 7) == red:
+                    moves.append(action)
+                # Whether it's capturable or not, we stop after the first piece
                 break
 
     return moves
@@ -355,36 +364,31 @@ def get_cannon_moves(board, i, j, color):
 # Pawns never move backward
 # Can only capture by moving forward or sideways — same as normal movement
 
-# Main conditions:
+# Main conditions (applied when the table is built):
 # Red moves "up" the board (i decreases)
 # -Black moves "down" the board (i increases)
 # Once across the river (Red: i < 5, Black: i >= 5), sideways movement is unlocked
 # Must stay on board and only capture opponent or move to empty square
 
-def get_pawn_moves(board, i, j, color):
+def _pawn_table(red):
+    table = []
+    for sq in range(90):
+        i, j = sq // 9, sq % 9
+        forward = -1 if red else 1
+        crossed = i < 5 if red else i >= 5
+        steps = [(forward, 0)] + ([(0, -1), (0, 1)] if crossed else [])
+        table.append([(ni * 9 + nj, _action(sq, ni * 9 + nj))
+                      for ni, nj in ((i + di, j + dj) for di, dj in steps) if is_in_board(ni, nj)])
+    return table
+
+pawn_table = [_pawn_table(False), _pawn_table(True)]
+
+def get_pawn_moves(squares, sq, red):
     moves = []
-    if color == 'red':
-        # Red pawns move up
-        if i > 0:
-            if is_empty(board, i-1, j) or is_opponent(board, i-1, j, color):
-                moves.append((i, j, i-1, j))
-        # If crossed river, can move horizontally
-        if i < 5:
-            for dj in [-1, 1]:
-                nj = j + dj
-                if is_in_board(i, nj) and (is_empty(board, i, nj) or is_opponent(board, i, nj, color)):
-                    moves.append((i, j, i, nj))
-    else:  # black
-        # Black pawns move down
-        if i < 9:
-            if is_empty(board, i+1, j) or is_opponent(board, i+1, j, color):
-                moves.append((i, j, i+1, j))
-        # If crossed river, can move horizontally
-        if i >= 5:
-            for dj in [-1, 1]:
-                nj = j + dj
-                if is_in_board(i, nj) and (is_empty(board, i, nj) or is_opponent(board, i, nj, color)):
-                    moves.append((i, j, i, nj))
+    for dst, action in pawn_table[red][sq]:
+        code = squares[dst]
+        if code == EMPTY or (code > 7) == red:
+            moves.append(action)
     return moves
 
 # Also, we need to get all legal moves for a specific piece at (i, j)
@@ -393,41 +397,233 @@ def get_pawn_moves(board, i, j, color):
 
 
 # It handles:
-# Skipping empty squares ('.')
+# Skipping empty squares (code 0)
 # Determining if the piece belongs to Red or Black
-# Dispatching to the correct rule-based movement logic 
-
-def get_piece_moves(board, i, j):
-    piece = board[i][j]
-    if piece == '.':
+# Dispatching to the correct rule-based movement logic through a table indexed by piece type
+
+piece_move_generators = {
+    KING: get_king_moves,
+    ADVISOR: get_advisor_moves,
+    ELEPHANT: get_elephant_moves,
+    HORSE: get_horse_moves,
+    CHARIOT: get_chariot_moves,
+    CANNON: get_cannon_moves,
+    PAWN: get_pawn_moves,
+}
+
+# The same dispatch indexed directly by piece code (index 0, the empty square, is unused)
+code_move_generators = [None] + [piece_move_generators[(code - 1) % 7] for code in range(1, 15)]
+
+def get_piece_moves(position, i, j):
+    code = position.squares[i * 9 + j]
+    if code == EMPTY:
         return []
     
-    color = 'red' if is_red(piece) else 'black'
-    
-    piece_lower = piece.lower()
-    if piece_lower == 'k':  # King
-        return get_king_moves(board, i, j, color)
-    elif piece_lower == 'a':  # Advisor
-        return get_advisor_moves(board, i, j, color)
-    elif piece_lower == 'b':  # Elephant
-        return get_elephant_moves(board, i, j, color)
-    elif piece_lower == 'n':  # Horse
-        return get_horse_moves(board, i, j, color)
-    elif piece_lower == 'r':  # Chariot
-        return get_chariot_moves(board, i, j, color)
-    elif piece_lower == 'c':  # Cannon
-        return get_cannon_moves(board, i, j, color)
-    elif piece_lower == 'p':  # Pawn
-        return get_pawn_moves(board, i, j, color)
-    return []
-
-# Get all legal moves for current player
-def get_all_moves(board, red_turn):
-    moves = []
-    for i in range(10):
-        for j in range(9):
-            piece = board[i][j]
-            if piece != '.':
-                if (red_turn and is_red(piece)) or (not red_turn and is_black(piece)):
-                    moves.extend(get_piece_moves(board, i, j))
-    return moves
\ No newline at end of file
+    actions = code_move_generators[code](position.squares, i * 9 + j, is_red(code))
+    return [action_moves[action] for action in actions]
+
+# Get all (pseudo-legal) moves for the side to move as an int array of action indices
+# This is what the search uses: the indices select the legal logits of the policy and are stored in the tree as is
+# (get_legal_actions below also drops the moves that leave the own King in check)
+def get_all_actions(position):
+    squares = position.squares
+    red = position.red_to_move
+    generators = code_move_generators
+    actions = []
+    for sq, code in enumerate(squares):
+        if code != EMPTY and (code < 8) == red:
+            actions.extend(generators[code](squares, sq, red))
+    return np.array(actions, dtype=np.int64)
+
+# Get all (pseudo-legal) moves for the side to move as (i1, j1, i2, j2) tuples (UI and analysis)
+def get_all_moves(position):
+    return [action_moves[action] for action in get_all_actions(position).tolist()]
+
+# Check and legality
+# get_all_actions() lists pseudo-legal moves: a move may leave the own King attacked, or facing the other King
+# Instead of generating every reply of the opponent, check detection looks outwards from the King square:
+# the first piece along one of the four rays is an enemy chariot, or the enemy King (the King Face-to-Face rule,
+# "flying general": only possible along the file, the palaces share no rank)
+# the second piece along a ray is an enemy cannon (the first one is its platform)
+# an enemy horse stands a horse jump away and its leg (the square next to the horse) is empty
+# an enemy pawn stands on a square from which it steps onto the King square
+# Advisors and elephants never leave their own half, so they cannot attack the enemy King
+# The horse and pawn tables are the move tables above reversed: attacker squares for every target square
+
+def _horse_attack_table():
+    table = [[] for _ in range(90)]
+    for sq in range(90):
+        for dst, leg, _ in horse_table[sq]:
+            table[dst].append((sq, leg))
+    return table
+
+horse_attack_table = _horse_attack_table()
+
+def _pawn_attack_table(red):
+    table = [[] for _ in range(90)]
+    for sq in range(90):
+        for dst, _ in pawn_table[red][sq]:
+            table[dst].append(sq)
+    return table
+
+pawn_attack_table = [_pawn_attack_table(False), _pawn_attack_table(True)]
+
+# True if the King of colour `red` standing on king_sq is attacked
+def is_king_attacked(squares, king_sq, red):
+    base = 8 if red else 1  # code of the enemy king, the other enemy pieces follow in piece type order
+    enemy_king, horse, chariot, cannon, pawn = base, base + HORSE, base + CHARIOT, base + CANNON, base + PAWN
+
+    for ray in rays[king_sq]:
+        platform = False
+        for dst, _ in ray:
+            code = squares[dst]
+            if code == EMPTY:
+                continue
+            if platform:
+                if code == cannon:
+                    return True
+                break
+            if code == chariot or code == enemy_king:
+                return True
+            platform = True
+
+    for horse_sq, leg in horse_attack_table[king_sq]:
+        if squares[horse_sq] == horse and squares[leg] == EMPTY:
+            return True
+    for pawn_sq in pawn_attack_table[not red][king_sq]:
+        if squares[pawn_sq] == pawn:
+            return True
+    return False
+
+# Is the King of `red` (the side to move by default) in check? A captured King counts as in check
+def is_in_check(position, red=None):
+    if red is None:
+        red = position.red_to_move
+    king_sq = position.red_king if red else position.black_king
+    return king_sq < 0 or is_king_attacked(position.squares, king_sq, red)
+
+# Moves that can expose the King of `red` (when it is not in check yet):
+# moves of the King itself
+# moves of the first piece along a ray when the second one is an enemy chariot or the enemy King, or the third one an
+# enemy cannon (moving it away uncovers them), and of the second piece when the third one is an enemy cannon
+# moves of a piece standing on the leg of an enemy horse a horse jump away from the King
+# moves onto the empty squares between the King and an enemy cannon that is the first piece on its ray (the moved
+# piece becomes the cannon's platform)
+# Pawn attacks cannot be uncovered, every other move keeps the King safe
+# _king_guards returns the squares of the pieces whose moves must be tested and the empty squares no move may enter
+# untested; the same walk finds out whether the King is attacked right now, and then it returns None
+
+def _king_guards(squares, king_sq, red):
+    base = 8 if red else 1
+    enemy_king, horse, chariot, cannon, pawn = base, base + HORSE, base + CHARIOT, base + CANNON, base + PAWN
+    sources = {king_sq}
+    gaps = []
+    for ray in rays[king_sq]:
+        gap = []
+        pieces = []
+        for dst, _ in ray:
+            if squares[dst] == EMPTY:
+                if not pieces:
+                    gap.append(dst)
+            else:
+                pieces.append(dst)
+                if len(pieces) == 3:
+                    break
+        codes = [squares[sq] for sq in pieces] + [EMPTY] * (3 - len(pieces))
+        if codes[0] == chariot or codes[0] == enemy_king or codes[1] == cannon:
+            return None
+        if codes[0] == cannon:
+            gaps.extend(gap)
+        if codes[1] == chariot or codes[1] == enemy_king or codes[2] == cannon:
+            sources.add(pieces[0])
+        if codes[2] == cannon:
+            sources.add(pieces[1])
+    for horse_sq, leg in horse_attack_table[king_sq]:
+        if squares[horse_sq] == horse:
+            if squares[leg] == EMPTY:
+                return None
+            sources.add(leg)
+    for pawn_sq in pawn_attack_table[not red][king_sq]:
+        if squares[pawn_sq] == pawn:
+            return None
+    return sources, gaps
+
+# Plays an action on the squares only (no key / plane update) and tells whether the own King is safe afterwards
+def _keeps_king_safe(squares, action, king_sq, red):
+    src, dst = divmod(action, 90)
+    piece = squares[src]
+    captured = squares[dst]
+    squares[dst] = piece
+    squares[src] = EMPTY
+    safe = not is_king_attacked(squares, dst if src == king_sq else king_sq, red)
+    squares[src] = piece
+    squares[dst] = captured
+    return safe
+
+# Fully legal moves for the side to move as an int array of action indices, in get_all_actions() order
+# In check every move is tested; otherwise only the moves of the guard pieces and the moves into a cannon's gap are,
+# the other pieces' moves are taken as generated
+def get_legal_actions(position):
+    squares = position.squares
+    red = position.red_to_move
+    king_sq = position.red_king if red else position.black_king
+    if king_sq < 0:
+        return np.array([], dtype=np.int64)
+    guards = _king_guards(squares, king_sq, red)
+    if guards is None:
+        return np.array([action for action in get_all_actions(position).tolist()
+                         if _keeps_king_safe(squares, action, king_sq, red)], dtype=np.int64)
+
+    sources, gaps = guards
+    generators = code_move_generators
+    actions = []
+    for sq, code in enumerate(squares):
+        if code != EMPTY and (code < 8) == red:
+            if sq in sources:
+                actions.extend(action for action in generators[code](squares, sq, red)
+                               if _keeps_king_safe(squares, action, king_sq, red))
+            else:
+                actions.extend(generators[code](squares, sq, red))
+    if gaps:
+        actions = [action for action in actions
+                   if action % 90 not in gaps or _keeps_king_safe(squares, action, king_sq, red)]
+    return np.array(actions, dtype=np.int64)
+
+# Fully legal moves as (i1, j1, i2, j2) tuples
+def get_legal_moves(position):
+    return [action_moves[action] for action in get_legal_actions(position).tolist()]
+
+# Compact action space
+# Out of the 8100 (src, dst) pairs only the ones some piece can geometrically make from src to dst are ever legal:
+# orthogonal lines (chariot, cannon, king, pawn), horse jumps, and the diagonal steps of advisors and elephants
+# compact_actions lists those action indices in increasing order (2238 of them, about 3.6x fewer) and
+# action_to_compact maps an action index to its position in that list (-1 for the unreachable pairs),
+# so a policy head only needs one output per entry
+# The search, the tree and the replay data keep using the 8100 action indices; only the network output is compact
+
+NUM_ACTIONS = 8100
+
+def _compact_actions():
+    reachable = set()
+    for red in (False, True):
+        for table in (king_table, pawn_table):
+            reachable.update(action for entries in table[red] for _, action in entries)
+        # The advisor and elephant tables also list moves from squares those pieces can never stand on
+        # (e.g. an advisor stepping into the palace from outside), so only their own squares count as sources
+        reachable.update(action for sq, entries in enumerate(advisor_table[red]) if is_in_palace(sq // 9, sq % 9, red)
+                         for _, action in entries)
+        reachable.update(action for sq, entries in enumerate(elephant_table[red]) if (sq >= 45) == red
+                         for _, _, action in entries)
+    reachable.update(action for entries in horse_table for _, _, action in entries)
+    reachable.update(action for directions in rays for ray in directions for _, action in ray)
+    return np.array(sorted(reachable), dtype=np.int64)
+
+compact_actions = _compact_actions()
+NUM_COMPACT_ACTIONS = len(compact_actions)
+action_to_compact = np.full(NUM_ACTIONS, -1, dtype=np.int64)
+action_to_compact[compact_actions] = np.arange(NUM_COMPACT_ACTIONS)
+
+# Columns of a policy output that hold the logits of the given action indices
+# An 8100-way head is indexed by action index directly, a compact head through action_to_compact
+def policy_columns(actions, num_logits):
+    return actions if num_logits == NUM_ACTIONS else action_to_compact[actions]
@@ -0,0 +1,211 @@
+#EE6892 Reinforcement Learning
+#Chinese Chess (Xiangqi) Root-Parallel Search Module
+
+# Lower latency for one position by spending idle cores on it
+# AlphaZero.get_move_probabilities runs its simulations one round after another in a single thread
+# RootParallelSearch runs num_workers independent searches of the same root at once, each in its own process with
+# its own search tree and its share of the simulation budget, and adds up their root visit counts
+# The merged visit distribution is returned exactly like a single search's action probabilities
+
+# The searches differ because every worker mixes its own Dirichlet noise into the root priors
+# (AlphaZero dirichlet_alpha, seeded with seed + worker id), otherwise they would all build the same tree
+# Root parallelism trades some search depth (every tree only gets a share of the simulations) for wall-clock time,
+# so it suits analysis of single critical positions; self-play gets more from many games in parallel (selfplay.py)
+
+# The workers are forked once and then stay alive between searches
+# The model is moved to shared memory (torch share_memory) before the fork, so all workers read one copy of the
+# weights; every worker runs its own forward passes with threads_per_worker torch threads
+# Create the RootParallelSearch before the parent process runs the model itself: forking a process whose OpenMP
+# thread pool is already running can hang the workers
+
+# Usage:
+# python parallel_search.py --model aznet_chinese_chess.pth --workers 4 --simulations 800 --compare
+# python parallel_search.py --fen "<fen>" --workers 4 --simulations 800
+
+import argparse
+import multiprocessing as mp
+import queue
+import time
+
+import numpy as np
+
+from alphazero import AlphaZero
+from mcts import MCTSTree
+from moves import action_index_to_move
+
+
+# Worker process: waits for states, searches each one with a fresh tree and sends back the root children's
+# action indices and visit counts (None for a position without moves)
+def _search_worker(worker_id, model, num_simulations, batch_size, time_limit, dirichlet_alpha, noise_fraction, seed,
+                   threads, task_queue, result_queue):
+    import torch
+
+    torch.set_num_threads(threads)
+    np.random.seed(seed)
+    agent = AlphaZero(model, num_simulations, batch_size, time_limit=time_limit, dirichlet_alpha=dirichlet_alpha,
+                      noise_fraction=noise_fraction)
+    while True:
+        state = task_queue.get()
+        if state is None:
+            return
+        agent.reset()
+        action_probs = agent.get_move_probabilities(state)
+        if action_probs is None:
+            result_queue.put((worker_id, None, None))
+        elif agent.tree is None:
+            # Forced move, nothing was searched
+            actions = np.flatnonzero(action_probs)
+            result_queue.put((worker_id, actions, action_probs[actions]))
+        else:
+            children = agent.tree.children(MCTSTree.ROOT)
+            result_queue.put((worker_id, agent.tree.action[children].copy(), agent.tree.visit_count[children].copy()))
+
+
+class RootParallelSearch:
+    def __init__(self, model, num_workers=4, num_simulations=800, batch_size=8, time_limit=None,
+                 dirichlet_alpha=0.3, noise_fraction=0.25, seed=0, threads_per_worker=1):
+        """
+        Start the worker processes of a root-parallel search.
+
+        Args:
+            model: A PyTorch model that outputs (policy_logits, value), shared with the workers through fork
+            num_workers: Number of independent searches (processes) per position
+            num_simulations: Total simulation budget of one search, split evenly between the workers
+            batch_size: Leaves per evaluation round of every worker's search
+            time_limit: Optional wall-clock budget of every worker's search in seconds
+            dirichlet_alpha: Root noise concentration that makes the workers' searches differ
+            noise_fraction: Weight of the noise in the root priors
+            seed: Worker k seeds np.random with seed + k
+            threads_per_worker: torch threads of every worker
+        """
+        if hasattr(model, "share_memory"):
+            model.share_memory()
+        ctx = mp.get_context("fork")
+        self.num_workers = num_workers
+        self.num_simulations = num_simulations
+        self.task_queues = [ctx.Queue() for _ in range(num_workers)]
+        self.result_queue = ctx.Queue()
+        self.workers = []
+        for k in range(num_workers):
+            share = num_simulations // num_workers + (k < num_simulations % num_workers)
+            worker = ctx.Process(target=_search_worker, args=(
+                k, model, max(share, 1), batch_size, time_limit, dirichlet_alpha, noise_fraction, seed + k,
+                threads_per_worker, self.task_queues[k], self.result_queue), daemon=True)
+            worker.start()
+            self.workers.append(worker)
+        # Root visit counts of every worker from the most recent search, for analysis
+        self.last_visits = None
+
+    def get_move_probabilities(self, state):
+        """
+        Search a state in all workers and merge their root visit counts.
+
+        Args:
+            state: The current game state (15x10x9 tensor as a NumPy array).
+
+        Returns:
+            action_probs: Merged visit distribution over all 8100 actions, or None if there are no legal moves.
+
+        Raises:
+            RuntimeError: If a worker died during the search (the remaining workers are stopped).
+        """
+        for task_queue in self.task_queues:
+            task_queue.put(state)
+        results = [self._get_result() for _ in self.workers]
+        if results[0][1] is None:
+            return None
+
+        visits = np.zeros((self.num_workers, 8100))
+        for worker_id, actions, counts in results:
+            visits[worker_id, actions] = counts
+        self.last_visits = visits
+        total = visits.sum(axis=0)
+        return total / np.sum(total)
+
+    # Waits for the next worker result, polling every `poll` seconds whether a worker has died
+    # (exception, OOM kill) instead of blocking forever on a result that never comes
+    def _get_result(self, poll=1.0):
+        while True:
+            try:
+                return self.result_queue.get(timeout=poll)
+            except queue.Empty:
+                failed = [k for k, worker in enumerate(self.workers) if worker.exitcode is not None]
+                if failed:
+                    self.terminate()
+                    raise RuntimeError(f"root-parallel search worker(s) {failed} died")
+
+    def select_move(self, state, temperature=0.0):
+        action_probs = self.get_move_probabilities(state)
+        if action_probs is None:
+            return None
+        return action_index_to_move(AlphaZero.sample_action(action_probs, temperature))
+
+    def close(self):
+        for task_queue in self.task_queues:
+            task_queue.put(None)
+        for worker in self.workers:
+            worker.join()
+        self.workers = []
+
+    # Stops all workers at once, e.g. after one of them died
+    def terminate(self):
+        for worker in self.workers:
+            if worker.is_alive():
+                worker.terminate()
+            worker.join()
+        self.workers = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main():
+    import torch
+    from aznet import AZNet, load_model
+    from board import START_FEN, fen_to_position, position_to_state
+    from moves import move_to_uci
+
+    parser = argparse.ArgumentParser(description="Root-parallel MCTS of one position across worker processes")
+    parser.add_argument("--model", default=None, help="AZNet checkpoint (random weights if omitted)")
+    parser.add_argument("--fen", default=START_FEN, help="position in FEN notation")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--simulations", type=int, default=800, help="total simulations over all workers")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--alpha", type=float, default=0.3, help="root Dirichlet noise concentration")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--compare", action="store_true", help="also run the same budget as one serial search")
+    args = parser.parse_args()
+
+    model = load_model(args.model) if args.model else AZNet().eval()
+    state = position_to_state(fen_to_position(args.fen))
+
+    with RootParallelSearch(model, args.workers, args.simulations, args.batch_size, dirichlet_alpha=args.alpha,
+                            seed=args.seed) as search:
+        start = time.perf_counter()
+        action_probs = search.get_move_probabilities(state)
+        elapsed = time.perf_counter() - start
+    if action_probs is None:
+        print("No legal moves")
+        return
+    top = np.argsort(action_probs)[::-1][:5]
+    print(f"root-parallel, {args.workers} workers: {elapsed:.3f}s")
+    for action in top:
+        print(f"  {move_to_uci(action_index_to_move(int(action)))} {action_probs[action]:.3f}")
+
+    if args.compare:
+        torch.set_num_threads(1)
+        agent = AlphaZero(model, args.simulations, args.batch_size)
+        start = time.perf_counter()
+        serial_probs = agent.get_move_probabilities(state)
+        serial_elapsed = time.perf_counter() - start
+        best = int(np.argmax(serial_probs))
+        print(f"serial: {serial_elapsed:.3f}s ({serial_elapsed / elapsed:.2f}x the root-parallel time), best move "
+              f"{move_to_uci(action_index_to_move(best))}, "
+              f"{'same as' if best == int(np.argmax(action_probs)) else 'differs from'} root-parallel")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+#EE6892 Reinforcement Learning
+#Chinese Chess (Xiangqi) Perft Module
+
+# Perft ("performance test") walks the full game tree of a position to a fixed depth and counts the leaf nodes
+# The counts are a correctness oracle for the move generator (any change that adds or drops a move changes them)
+# and the time taken is its throughput number (leaf nodes per second)
+# divide lists the count below every root move separately, which pins a wrong count down to the move that causes it
+
+# The tree is walked with a single Position and make_action / unmake_action, the same way the search does
+# A position where a king has been captured is over and has no children (get_all_actions does not know that,
+# so the walk checks is_king_captured); at depth 1 the moves are counted without being made (bulk counting)
+
+# REFERENCE_POSITIONS holds FEN positions (see board.fen_to_position) with their leaf counts, first for the
+# pseudo-legal generator get_all_actions and then for the fully legal one get_legal_actions (legal=True)
+# The pseudo-legal counts agree with the original list-board move generator of the first version of moves.py
+# The legal counts of the standard opening are the published Xiangqi perft numbers (44, 1920, 79666, 3290240); the
+# others agree with a plain legality test that plays every reply of the opponent
+
+# Usage:
+# python perft.py --check                       (reference suite: verify counts, report nodes/sec)
+# python perft.py --check --legal               (the same with fully legal moves)
+# python perft.py --fen "<fen>" --depth 3 --divide
+
+import argparse
+import time
+
+from board import START_FEN, fen_to_position, init_position, position_to_fen, is_king_captured
+from moves import get_all_actions, get_legal_actions, action_moves, move_to_uci
+
+
+REFERENCE_POSITIONS = [
+    ("standard opening", START_FEN,
+     {1: 44, 2: 1926, 3: 80288, 4: 3343044}, {1: 44, 2: 1920, 3: 79666, 4: 3290240}),
+    ("init_board opening", position_to_fen(init_position()),
+     {1: 42, 2: 1754, 3: 72056, 4: 2956860}, {1: 42, 2: 1751, 3: 71680, 4: 2921500}),
+    ("middlegame", "r1ba1a3/4kn3/2n1b4/pNp1p1p1p/4c4/6P2/P1P2R2P/1CcC5/9/2BAKAB2 w - - 0 1",
+     {1: 44, 2: 1329, 3: 56972, 4: 1774739}, {1: 38, 2: 1128, 3: 43929, 4: 1339047}),
+    ("endgame", "3k5/4a4/4b4/9/2p6/6B2/9/4B4/4A4/3AK4 b - - 0 1",
+     {1: 9, 2: 72, 3: 605, 4: 4900}, {1: 9, 2: 72, 3: 604, 4: 4887}),
+]
+
+
+def perft(position, depth, legal=False):
+    if depth == 0:
+        return 1
+    if is_king_captured(position):
+        return 0
+    actions = (get_legal_actions if legal else get_all_actions)(position).tolist()
+    if depth == 1:
+        return len(actions)
+    nodes = 0
+    for action in actions:
+        captured = position.make_action(action)
+        nodes += perft(position, depth - 1, legal)
+        position.unmake_action(action, captured)
+    return nodes
+
+
+# Leaf counts below each root move, keyed by the move in UCI notation
+def divide(position, depth, legal=False):
+    counts = {}
+    for action in (get_legal_actions if legal else get_all_actions)(position).tolist():
+        captured = position.make_action(action)
+        counts[move_to_uci(action_moves[action])] = perft(position, depth - 1, legal)
+        position.unmake_action(action, captured)
+    return counts
+
+
+# Runs perft and returns (leaf nodes, seconds, nodes per second)
+def timed_perft(position, depth, legal=False):
+    start = time.perf_counter()
+    nodes = perft(position, depth, legal)
+    elapsed = time.perf_counter() - start
+    return nodes, elapsed, nodes / elapsed if elapsed > 0 else float("inf")
+
+
+# Verifies every reference count up to max_depth; returns True if all of them match
+def check_reference(max_depth=3, legal=False):
+    all_ok = True
+    total_nodes, total_time = 0, 0.0
+    for name, fen, pseudo_legal_counts, legal_counts in REFERENCE_POSITIONS:
+        for depth, expected in sorted((legal_counts if legal else pseudo_legal_counts).items()):
+            if depth > max_depth:
+                continue
+            nodes, elapsed, rate = timed_perft(fen_to_position(fen), depth, legal)
+            ok = nodes == expected
+            all_ok &= ok
+            total_nodes += nodes
+            total_time += elapsed
+            print(f"{name:<20} depth {depth}: {nodes:>9} {'ok' if ok else f'FAILED (expected {expected})':<8} "
+                  f"{elapsed:8.3f}s {rate:>12,.0f} nodes/sec")
+    print(f"{'all' if all_ok else 'NOT all'} counts match, {total_nodes:,} nodes in {total_time:.2f}s "
+          f"({total_nodes / max(total_time, 1e-9):,.0f} nodes/sec)")
+    return all_ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Perft leaf counts and move generation throughput")
+    parser.add_argument("--fen", default=START_FEN, help="position in FEN notation")
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--divide", action="store_true", help="print the count below every root move")
+    parser.add_argument("--check", action="store_true", help="verify the reference positions up to --depth")
+    parser.add_argument("--legal", action="store_true", help="fully legal moves (moves.get_legal_actions)")
+    args = parser.parse_args()
+
+    if args.check:
+        raise SystemExit(0 if check_reference(args.depth, args.legal) else 1)
+
+    position = fen_to_position(args.fen)
+    if args.divide:
+        for uci, count in sorted(divide(position, args.depth, args.legal).items()):
+            print(f"{uci}: {count}")
+    nodes, elapsed, rate = timed_perft(position, args.depth, args.legal)
+    print(f"depth {args.depth}: {nodes} nodes in {elapsed:.3f}s ({rate:,.0f} nodes/sec)")
+
+
+if __name__ == "__main__":
+    main()
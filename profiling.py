@@ -0,0 +1,156 @@
+#EE6892 Reinforcement Learning
+#Chinese Chess (Xiangqi) Search Profiling Module
+
+# Where does the time of a search go?
+# AlphaZero(collect_stats=True) fills a SearchStats object for every get_move_probabilities() call (agent.last_stats)
+# With collect_stats=False (the default) the search skips every hook behind a single `if stats:` check
+
+# Phase timers work like laps: lap(phase) charges the time since the previous lap to that phase, so the phases
+# add up to the whole search
+# position: decoding the input state into the working Position (state_to_position, planes)
+# movegen: legal move generation (get_all_actions) at the root and at every leaf
+# selection: walking down the tree with PUCT, including make_action along the path
+# evaluate: the evaluator / network call (predict) for a batch of leaves, including cache lookups
+# expand: creating the children of evaluated leaves and undoing the path moves (unmake_action)
+# backup: propagating values back up the search paths (and virtual loss bookkeeping)
+
+# Counters: simulations, nodes created, leaves evaluated and evaluator calls, cache hits and misses, terminal leaves,
+# collisions (a round stopped because a pending leaf was selected again), depth of the selected leaves and the
+# number of children of expanded nodes (branching factor), forced moves (searches skipped for a single legal move)
+# and early stops (searches ended because the best move could no longer change, see AlphaZero early_stop)
+
+# SearchStats objects add up (stats += other), so a whole game or self-play run can be summarized in one object
+# profile_search() runs a single search under cProfile and can dump the profile for snakeviz / pstats
+# (for a sampling profile of a longer run use an external sampler, e.g. py-spy record -- python selfplay.py ...)
+
+# Usage:
+# python profiling.py --simulations 400 --batch-size 8 --cprofile search.prof
+
+import argparse
+import cProfile
+import pstats
+import time
+
+
+PHASES = ("position", "movegen", "selection", "evaluate", "expand", "backup")
+COUNTERS = ("searches", "simulations", "nodes_created", "evaluations", "evaluator_calls", "cache_hits", "cache_misses",
+            "terminal_leaves", "collisions", "depth_total", "max_depth", "expansions", "children_total",
+            "forced_moves", "early_stops")
+
+
+class SearchStats:
+    def __init__(self):
+        self.times = dict.fromkeys(PHASES, 0.0)
+        for name in COUNTERS:
+            setattr(self, name, 0)
+        self.mark = time.perf_counter()
+
+    # Restart the lap clock (at the start of a search)
+    def start(self):
+        self.mark = time.perf_counter()
+
+    # Charge the time since the previous lap to `phase`
+    def lap(self, phase):
+        now = time.perf_counter()
+        self.times[phase] += now - self.mark
+        self.mark = now
+
+    def __iadd__(self, other):
+        for phase in PHASES:
+            self.times[phase] += other.times[phase]
+        for name in COUNTERS:
+            if name == "max_depth":
+                self.max_depth = max(self.max_depth, other.max_depth)
+            else:
+                setattr(self, name, getattr(self, name) + getattr(other, name))
+        return self
+
+    def __add__(self, other):
+        total = SearchStats()
+        total += self
+        total += other
+        return total
+
+    @property
+    def total_time(self):
+        return sum(self.times.values())
+
+    # Plain dict with the raw numbers and the derived rates, handy for logging and JSON
+    def summary(self):
+        total = self.total_time
+        lookups = self.cache_hits + self.cache_misses
+        result = {name: getattr(self, name) for name in COUNTERS}
+        result.update({
+            "seconds": total,
+            "phase_seconds": dict(self.times),
+            "phase_share": {phase: t / total if total else 0.0 for phase, t in self.times.items()},
+            "simulations_per_second": self.simulations / total if total else 0.0,
+            "mean_depth": self.depth_total / self.simulations if self.simulations else 0.0,
+            "branching_factor": self.children_total / self.expansions if self.expansions else 0.0,
+            "mean_evaluation_batch": self.evaluations / self.evaluator_calls if self.evaluator_calls else 0.0,
+            "cache_hit_rate": self.cache_hits / lookups if lookups else 0.0,
+        })
+        return result
+
+    def report(self):
+        summary = self.summary()
+        lines = [f"{self.searches} searches, {self.simulations} simulations in {summary['seconds']:.3f}s "
+                 f"({summary['simulations_per_second']:.1f}/s)"]
+        for phase in PHASES:
+            lines.append(f"  {phase:<10} {self.times[phase]:8.3f}s {summary['phase_share'][phase]:6.1%}")
+        lines.append(f"  nodes created {self.nodes_created}, evaluations {self.evaluations} in {self.evaluator_calls} "
+                     f"calls (mean batch {summary['mean_evaluation_batch']:.1f}), cache hit rate "
+                     f"{summary['cache_hit_rate']:.1%}")
+        lines.append(f"  depth mean {summary['mean_depth']:.1f} max {self.max_depth}, branching factor "
+                     f"{summary['branching_factor']:.1f}, terminal leaves {self.terminal_leaves}, "
+                     f"collisions {self.collisions}")
+        lines.append(f"  forced moves {self.forced_moves}, early stops {self.early_stops}")
+        return "\n".join(lines)
+
+
+# Runs one search of `agent` from `state` under cProfile
+# Returns the action probabilities and the pstats.Stats; output_path also dumps the raw profile
+def profile_search(agent, state, output_path=None):
+    profiler = cProfile.Profile()
+    profiler.enable()
+    action_probs = agent.get_move_probabilities(state)
+    profiler.disable()
+    if output_path:
+        profiler.dump_stats(output_path)
+    return action_probs, pstats.Stats(profiler)
+
+
+def main():
+    from alphazero import AlphaZero
+    from aznet import AZNet, load_model
+    from board import init_position, position_to_state
+    from evaluators import FakeEvaluator
+
+    parser = argparse.ArgumentParser(description="Per-phase statistics and cProfile of a single search")
+    parser.add_argument("--model", default=None, help="AZNet checkpoint (random weights if omitted)")
+    parser.add_argument("--fake", action="store_true", help="use evaluators.FakeEvaluator instead of AZNet")
+    parser.add_argument("--simulations", type=int, default=400)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--cprofile", default=None, help="also profile the search and dump the profile here")
+    parser.add_argument("--top", type=int, default=20, help="functions shown from the profile")
+    args = parser.parse_args()
+
+    if args.fake:
+        model = FakeEvaluator()
+    else:
+        model = load_model(args.model) if args.model else AZNet().eval()
+    state = position_to_state(init_position())
+
+    agent = AlphaZero(model, args.simulations, args.batch_size, collect_stats=True)
+    agent.get_move_probabilities(state)
+    print(agent.last_stats.report())
+
+    if args.cprofile:
+        agent.reset()
+        _, profile = profile_search(agent, state, args.cprofile)
+        profile.sort_stats("cumulative").print_stats(args.top)
+        print(f"Saved {args.cprofile}")
+
+
+if __name__ == "__main__":
+    main()
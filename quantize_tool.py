@@ -0,0 +1,86 @@
+#EE6892 Reinforcement Learning
+#Chinese Chess (Xiangqi) Quantization Check Module
+
+# Measures how closely the dynamic INT8 AZNet (aznet.quantize_model) agrees with the float model
+# Network agreement (export_model.parity_check on random playout positions): top-1 legal move match rate,
+#   largest policy logit error and value error, plus the mean absolute value error
+# Search agreement: an AlphaZero agent with each model searches the same positions with the same number of
+#   simulations and we count how often both pick the same move (greedy, temperature 0)
+# Weight memory: serialized size of each model's state dict (the float heads are ~90% of the parameters)
+
+# Usage:
+# python quantize_tool.py --model aznet_chinese_chess.pth --positions 256 --search-positions 20 --simulations 100
+
+import argparse
+import io
+
+import numpy as np
+import torch
+
+from alphazero import AlphaZero
+from aznet import AZNet, load_model, quantize_model
+from board import position_to_state
+from export_model import parity_check, measure_latency
+from utils import random_positions
+
+
+# Bytes taken by a model's weights (the size of its serialized state dict)
+def weight_bytes(model):
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.getbuffer().nbytes
+
+
+def mean_value_error(reference, candidate, num_positions=256, seed=0):
+    positions = random_positions(num_positions, seed)
+    states = torch.from_numpy(np.stack([position_to_state(position) for position in positions]))
+    with torch.inference_mode():
+        return (reference(states)[1] - candidate(states)[1]).abs().mean().item()
+
+
+# Fraction of positions on which both models' searches choose the same move
+def search_agreement(reference, candidate, num_positions=20, num_simulations=100, batch_size=8, seed=1):
+    positions = random_positions(num_positions, seed)
+    agree = 0
+    for position in positions:
+        state = position_to_state(position)
+        moves = [AlphaZero(model, num_simulations, batch_size).select_move(state) for model in (reference, candidate)]
+        agree += int(moves[0] == moves[1])
+    return agree / num_positions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the dynamic INT8 AZNet against the float model")
+    parser.add_argument("--model", default=None, help="AZNet checkpoint (random weights if omitted)")
+    parser.add_argument("--positions", type=int, default=256, help="positions for the network comparison")
+    parser.add_argument("--search-positions", type=int, default=20, help="positions for the MCTS comparison")
+    parser.add_argument("--simulations", type=int, default=100)
+    parser.add_argument("--batch-size", type=int, default=8, help="leaves evaluated per search batch")
+    parser.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    reference = load_model(args.model) if args.model else AZNet().eval()
+    quantized = quantize_model(reference)
+
+    parity = parity_check(reference, quantized, args.positions)
+    print(f"Network on {parity['positions']} positions: top-1 match {parity['top1_match_rate']:.1%}, "
+          f"max logit error {parity['max_logit_error']:.2e}, max value error {parity['max_value_error']:.2e}, "
+          f"mean value error {mean_value_error(reference, quantized, args.positions):.2e}")
+
+    agreement = search_agreement(reference, quantized, args.search_positions, args.simulations, args.batch_size)
+    print(f"MCTS on {args.search_positions} positions ({args.simulations} simulations): move agreement {agreement:.1%}")
+
+    float_bytes, int8_bytes = weight_bytes(reference), weight_bytes(quantized)
+    print(f"Weight memory: float {float_bytes / 2**20:.1f} MB, int8 {int8_bytes / 2**20:.1f} MB "
+          f"({float_bytes / int8_bytes:.2f}x smaller)")
+
+    float_latency = measure_latency(reference, (1, 8, 64), repeats=10)
+    int8_latency = measure_latency(quantized, (1, 8, 64), repeats=10)
+    for batch_size in float_latency:
+        print(f"batch {batch_size}: float {float_latency[batch_size]:.2f} ms, int8 {int8_latency[batch_size]:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+#EE6892 Reinforcement Learning
+#Chinese Chess (Xiangqi) Replay Buffer Module
+
+# Compact on-disk storage of self-play training data
+# A training sample as produced by self-play is a 15x10x9 float32 state (5.4 KB) plus an 8100-float policy (32 KB)
+# Almost all of it is zeros, so on disk we keep:
+# positions: 91 int8 per position, the 90 piece codes of board.Position followed by the side to move (1 = Red)
+# policies: sparse (action index, visit count) pairs, CSR style (policy_offsets[n]:policy_offsets[n + 1] are position n's pairs)
+# outcomes: int8 game result from the side to move's view (+1 win, -1 loss, 0 draw)
+# That is roughly 91 + 40 * 6 bytes per position instead of ~38 KB
+
+# Data is written in shards, each a directory of .npy files holding a run of consecutive games:
+# shard_000000/positions.npy, outcomes.npy, policy_offsets.npy, policy_actions.npy, policy_visits.npy, game_offsets.npy
+# Shards are opened with np.load(mmap_mode="r"), so sampling touches only the rows it needs and nothing is loaded into RAM
+# ReplayBuffer only exposes the newest window_games games (a sliding window over the shards)
+# Left-right mirror augmentation (Xiangqi is symmetric about the middle file) is applied when samples are drawn
+
+# Usage (convert selfplay.py output into a replay directory):
+# python replay.py selfplay_games replay_data
+
+import argparse
+import glob
+import os
+
+import numpy as np
+
+from board import state_to_position
+
+
+SHARD_FILES = ("positions", "outcomes", "policy_offsets", "policy_actions", "policy_visits", "game_offsets")
+
+# Mirror tables: file j ↔ 8 - j for squares, and (src, dst) → (mirror src, mirror dst) for action indices
+mirror_squares = np.array([i * 9 + (8 - j) for i in range(10) for j in range(9)], dtype=np.int64)
+mirror_actions = (mirror_squares[:, None] * 90 + mirror_squares[None, :]).reshape(-1)
+
+
+# Compact position row (91 int8) of a Position
+def compact_position(position):
+    row = np.empty(91, dtype=np.int8)
+    row[:90] = np.frombuffer(position.squares, dtype=np.uint8)
+    row[90] = position.red_to_move
+    return row
+
+
+# Expand a batch of compact position rows (B, 91) into network input states (B, 15, 10, 9)
+# Same encoding as board.position_to_state, done for the whole batch with one scatter
+def compact_to_states(positions):
+    positions = np.asarray(positions)
+    batch = len(positions)
+    states = np.zeros((batch, 15, 90), dtype=np.float32)
+    codes = positions[:, :90]
+    rows, squares = np.nonzero(codes)
+    states[rows, codes[rows, squares].astype(np.int64) - 1, squares] = 1
+    states[:, 14, :] = positions[:, 90:91]
+    return states.reshape(batch, 15, 10, 9)
+
+
+# Writes games into new shards of a replay directory
+# Games are buffered in memory and flushed as one shard every shard_games games (and on close())
+class ReplayWriter:
+    def __init__(self, directory, shard_games=1000):
+        self.directory = directory
+        self.shard_games = shard_games
+        os.makedirs(directory, exist_ok=True)
+        self._reset()
+
+    def _reset(self):
+        self.positions, self.outcomes, self.actions, self.visits, self.game_lengths = [], [], [], [], []
+
+    # positions: (T, 91) int8 compact rows, policies: T (actions, visits) pairs, outcomes: (T,)
+    def add_game(self, positions, policies, outcomes):
+        self.positions.append(np.asarray(positions, dtype=np.int8))
+        self.outcomes.append(np.asarray(outcomes, dtype=np.int8))
+        for actions, visits in policies:
+            self.actions.append(np.asarray(actions, dtype=np.int16))
+            self.visits.append(np.asarray(visits, dtype=np.float32))
+        self.game_lengths.append(len(positions))
+        if len(self.game_lengths) >= self.shard_games:
+            self.flush()
+
+    # Same as add_game for the dense output of selfplay.play_selfplay_game (states, 8100-way policies, outcomes)
+    def add_selfplay_game(self, states, policies, outcomes):
+        positions = np.stack([compact_position(state_to_position(state)) for state in states]) if len(states) else \
+            np.zeros((0, 91), dtype=np.int8)
+        sparse = [(np.flatnonzero(policy), policy[np.flatnonzero(policy)]) for policy in policies]
+        self.add_game(positions, sparse, np.rint(outcomes))
+
+    def flush(self):
+        if not self.game_lengths:
+            return
+        existing = sorted(glob.glob(os.path.join(self.directory, "shard_*[0-9]")))
+        index = int(os.path.basename(existing[-1])[6:]) + 1 if existing else 0
+        final = os.path.join(self.directory, f"shard_{index:06d}")
+        tmp = final + ".tmp"
+        os.makedirs(tmp)
+
+        lengths = [len(a) for a in self.actions]
+        arrays = {
+            "positions": np.concatenate(self.positions),
+            "outcomes": np.concatenate(self.outcomes),
+            "policy_offsets": np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64),
+            "policy_actions": np.concatenate(self.actions) if self.actions else np.zeros(0, dtype=np.int16),
+            "policy_visits": np.concatenate(self.visits) if self.visits else np.zeros(0, dtype=np.float32),
+            "game_offsets": np.concatenate([[0], np.cumsum(self.game_lengths)]).astype(np.int64),
+        }
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp, name + ".npy"), array)
+        # Rename last so readers never see a half-written shard
+        os.rename(tmp, final)
+        self._reset()
+
+    def close(self):
+        self.flush()
+
+
+# Memory-mapped view of the newest window_games games of a replay directory
+# Call refresh() to pick up shards written since the buffer was opened
+class ReplayBuffer:
+    def __init__(self, directory, window_games=None, augment=True):
+        self.directory = directory
+        self.window_games = window_games
+        self.augment = augment
+        self.refresh()
+
+    def refresh(self):
+        shards = []
+        for path in sorted(glob.glob(os.path.join(self.directory, "shard_*[0-9]")), reverse=True):
+            shards.append({name: np.load(os.path.join(path, name + ".npy"), mmap_mode="r") for name in SHARD_FILES})
+        # Walk from the newest shard back until the window is full
+        selected, games = [], 0
+        for shard in shards:
+            num_games = len(shard["game_offsets"]) - 1
+            start = 0
+            if self.window_games is not None and games + num_games > self.window_games:
+                # Only the newest games of this shard fit in the window
+                start = int(shard["game_offsets"][num_games - (self.window_games - games)])
+            selected.append((shard, start))
+            games += num_games
+            if self.window_games is not None and games >= self.window_games:
+                break
+        selected.reverse()
+        self.shards = [shard for shard, _ in selected]
+        self.starts = np.array([start for _, start in selected], dtype=np.int64)
+        sizes = np.array([len(shard["positions"]) for shard in self.shards], dtype=np.int64) - self.starts
+        self.cumulative = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+
+    def __len__(self):
+        return int(self.cumulative[-1])
+
+    # Random access to one sample: (compact position (91,), policy actions, policy visits, outcome)
+    def get(self, index):
+        shard_index = int(np.searchsorted(self.cumulative, index, side="right")) - 1
+        shard = self.shards[shard_index]
+        row = int(index - self.cumulative[shard_index] + self.starts[shard_index])
+        begin, end = shard["policy_offsets"][row], shard["policy_offsets"][row + 1]
+        return (np.array(shard["positions"][row]), np.array(shard["policy_actions"][begin:end], dtype=np.int64),
+                np.array(shard["policy_visits"][begin:end]), float(shard["outcomes"][row]))
+
+    # Draws batch_size random samples
+    # Returns compact positions (B, 91) int8, dense normalized policies (B, 8100) float32 and outcomes (B,) float32
+    # With augment=True every sample is mirrored left-right with probability 1/2 (positions and policy actions together)
+    def sample(self, batch_size, rng=None):
+        rng = np.random.default_rng() if rng is None else rng
+        indices = rng.integers(0, len(self), size=batch_size)
+        mirror = rng.random(batch_size) < 0.5 if self.augment else np.zeros(batch_size, dtype=bool)
+
+        positions = np.empty((batch_size, 91), dtype=np.int8)
+        policies = np.zeros((batch_size, 8100), dtype=np.float32)
+        outcomes = np.empty(batch_size, dtype=np.float32)
+        for b, index in enumerate(indices):
+            position, actions, visits, outcome = self.get(index)
+            if mirror[b]:
+                position[:90] = position[:90][mirror_squares]
+                actions = mirror_actions[actions]
+            positions[b] = position
+            policies[b, actions] = visits / max(visits.sum(), 1e-8)
+            outcomes[b] = outcome
+        return positions, policies, outcomes
+
+
+# Converts selfplay.py game files into replay shards
+def ingest_selfplay_games(game_paths, directory, shard_games=1000):
+    writer = ReplayWriter(directory, shard_games)
+    for path in game_paths:
+        with np.load(path) as game:
+            writer.add_selfplay_game(game["states"], game["policies"], game["outcomes"])
+    writer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert self-play game files into a compact replay directory")
+    parser.add_argument("games", help="directory of selfplay.py game_*.npz files")
+    parser.add_argument("output", help="replay directory (shards are appended)")
+    parser.add_argument("--shard-games", type=int, default=1000)
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(args.games, "game_*.npz")))
+    ingest_selfplay_games(paths, args.output, args.shard_games)
+    buffer = ReplayBuffer(args.output)
+    print(f"{len(paths)} games ingested, {len(buffer)} positions in {len(buffer.shards)} shards")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,345 @@
+#EE6892 Reinforcement Learning
+#Chinese Chess (Xiangqi) Self-Play Module
+
+# Headless self-play driver for generating training data
+# utils.play_game plays one game in-process with prints, which is fine for watching the agent but caps
+# data generation at one Python interpreter running the network at batch size 1
+# Here the work is split between processes:
+
+# Inference server (one process): owns AZNet (as an inference build, see aznet.build_inference_model, optionally
+#   with INT8 linear layers), collects evaluation requests from all workers, batches them dynamically
+#   (whatever has arrived within max_wait, up to max_batch states) and runs one forward pass
+# Self-play workers (N processes): each one plays games with its own AlphaZero agent and search tree
+#   When the search needs leaf evaluations it writes the states into its shared-memory request buffer,
+#   sends a (worker_id, count) message on the shared request queue and waits on its own response queue
+#   The server writes policy logits and values straight into the worker's shared-memory response buffer
+#   so the queues only ever carry tiny control messages
+
+# With collect_stats every worker sums the SearchStats (profiling.py) of all its searches and the run summary
+# includes the per-phase totals of all workers
+
+# Every finished game is written to the output directory as game_<worker>_<index>.npz with
+# states (T, 15, 10, 9), policies (T, 8100) MCTS visit distributions and outcomes (T,) from the side to move's view
+
+# Usage:
+# python selfplay.py --workers 4 --games 100 --simulations 200 --batch-size 8 --model aznet_chinese_chess.pth --output selfplay_games
+
+import argparse
+import os
+import queue
+import time
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from board import init_position, position_to_state, is_king_captured, make_move
+from moves import NUM_ACTIONS, NUM_COMPACT_ACTIONS, action_index_to_move
+from profiling import SearchStats
+
+
+STATE_SIZE = 15 * 10 * 9
+
+
+# Shared-memory buffers of one worker
+# request: (max_batch, 15, 10, 9) float32 states, response: (max_batch, num_actions + 1) float32 logits followed by
+# the value, where num_actions is the size of the model's policy head (8100, or 2238 for a compact head)
+class WorkerBuffers:
+    def __init__(self, max_batch, names=None, num_actions=NUM_ACTIONS):
+        self.max_batch = max_batch
+        self.num_actions = num_actions
+        request_bytes = max_batch * STATE_SIZE * 4
+        response_bytes = max_batch * (num_actions + 1) * 4
+        if names is None:
+            self.request_shm = shared_memory.SharedMemory(create=True, size=request_bytes)
+            self.response_shm = shared_memory.SharedMemory(create=True, size=response_bytes)
+        else:
+            self.request_shm = shared_memory.SharedMemory(name=names[0])
+            self.response_shm = shared_memory.SharedMemory(name=names[1])
+        self.requests = np.ndarray((max_batch, 15, 10, 9), dtype=np.float32, buffer=self.request_shm.buf)
+        self.responses = np.ndarray((max_batch, num_actions + 1), dtype=np.float32, buffer=self.response_shm.buf)
+
+    @property
+    def names(self):
+        return self.request_shm.name, self.response_shm.name
+
+    def close(self):
+        # Drop the array views before closing the mapping
+        del self.requests, self.responses
+        self.request_shm.close()
+        self.response_shm.close()
+
+    def unlink(self):
+        self.request_shm.unlink()
+        self.response_shm.unlink()
+
+
+# Inference server
+# Blocks for the first request, then keeps collecting requests for up to max_wait seconds or until max_batch
+# states are waiting, runs the model once on all of them and answers every worker in the batch
+# A (worker_id, 0) message means that worker has finished; the server exits when all workers are done
+
+def inference_server(model_path, buffer_names, max_batch_per_worker, request_queue, response_queues,
+                     max_batch=256, max_wait=0.001, num_threads=None, stats_queue=None,
+                     inference_backend="script", quantize=False, compact=False):
+    import torch
+    from aznet import AZNet, load_model, build_inference_model, quantize_model
+
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    model = load_model(model_path, compact=compact) if model_path else AZNet(compact).eval()
+    # The buffers were sized for the head run_selfplay expected; a model with a different head cannot answer
+    num_actions = model.p_fc.out_features
+    expected = NUM_COMPACT_ACTIONS if compact else NUM_ACTIONS
+    if num_actions != expected:
+        raise ValueError(f"model policy head has {num_actions} outputs, the worker buffers expect {expected}")
+    if inference_backend != "eager":
+        model = build_inference_model(model, backend=inference_backend, quantize=quantize)
+    elif quantize:
+        model = quantize_model(model)
+    buffers = [WorkerBuffers(max_batch_per_worker, names, num_actions) for names in buffer_names]
+
+    active = len(buffers)
+    forward_passes = 0
+    evaluated = 0
+    while active:
+        batch = []
+        total = 0
+        worker_id, count = request_queue.get()
+        deadline = time.perf_counter() + max_wait
+        while True:
+            if count == 0:
+                active -= 1
+            else:
+                batch.append((worker_id, count))
+                total += count
+            if total >= max_batch or not active:
+                break
+            timeout = deadline - time.perf_counter()
+            try:
+                worker_id, count = request_queue.get(timeout=timeout) if timeout > 0 else request_queue.get_nowait()
+            except queue.Empty:
+                break
+
+        if not batch:
+            continue
+
+        states = np.concatenate([buffers[w].requests[:n] for w, n in batch])
+        with torch.inference_mode():
+            policy_logits, values = model(torch.from_numpy(states))
+        policy_logits = policy_logits.numpy()
+        values = values.reshape(-1).numpy()
+
+        offset = 0
+        for w, n in batch:
+            buffers[w].responses[:n, :num_actions] = policy_logits[offset:offset + n]
+            buffers[w].responses[:n, num_actions] = values[offset:offset + n]
+            offset += n
+            response_queues[w].put(n)
+        forward_passes += 1
+        evaluated += total
+
+    for buffer in buffers:
+        buffer.close()
+    if stats_queue is not None:
+        stats_queue.put({"forward_passes": forward_passes, "evaluated_states": evaluated})
+
+
+# Plays one self-play game with the given agent
+# The first temperature_moves plies sample from the visit distribution with `temperature`, later plies play greedily
+# Returns the states, MCTS action probabilities and per-state outcomes (+1 win, -1 loss, 0 draw for the side to move)
+# If the agent collects search statistics and `stats` is a SearchStats, every search of the game is added to it
+
+def play_selfplay_game(agent, max_moves=200, temperature=1.0, temperature_moves=30, stats=None):
+    position = init_position()
+    state = position_to_state(position)
+    agent.reset()
+
+    states, policies, red_to_move = [], [], []
+    winner = 0  # +1 red, -1 black, 0 draw
+    for ply in range(max_moves):
+        action_probs = agent.get_move_probabilities(state)
+        if stats is not None and agent.last_stats is not None:
+            stats += agent.last_stats
+        if action_probs is None:
+            break  # No valid moves, scored as a draw like in the search
+
+        states.append(state)
+        policies.append(action_probs.astype(np.float32))
+        red_to_move.append(position.red_to_move)
+
+        action = agent.sample_action(action_probs, temperature if ply < temperature_moves else 0.0)
+        move = action_index_to_move(action)
+        state = make_move(state, move)
+        position.make_move(move)
+        agent.update_with_move(move)
+
+        if is_king_captured(position):
+            winner = 1 if red_to_move[-1] else -1
+            break
+
+    outcomes = np.array([winner if red else -winner for red in red_to_move], dtype=np.float32)
+    return np.array(states, dtype=np.float32), np.array(policies, dtype=np.float32), outcomes
+
+
+# Worker side of the server: an evaluator whose batched predictions are answered by the inference server
+def _make_remote_agent(worker_id, buffers, request_queue, response_queue, num_simulations, batch_size,
+                       collect_stats=False):
+    from alphazero import AlphaZero
+    from evaluators import LogitsEvaluator
+
+    class RemoteEvaluator(LogitsEvaluator):
+        def predict_batch(self, states):
+            n = len(states)
+            buffers.requests[:n] = np.stack(states)
+            request_queue.put((worker_id, n))
+            response_queue.get()
+            responses = buffers.responses[:n]
+            return responses[:, :buffers.num_actions].copy(), responses[:, buffers.num_actions].copy()
+
+    return AlphaZero(RemoteEvaluator(), num_simulations=num_simulations, batch_size=batch_size,
+                     collect_stats=collect_stats)
+
+
+def selfplay_worker(worker_id, buffer_names, max_batch, request_queue, response_queue, num_games, output_dir,
+                    num_simulations, batch_size, max_moves, temperature, temperature_moves, seed, result_queue,
+                    num_actions=NUM_ACTIONS, collect_stats=False):
+    np.random.seed(seed)
+    buffers = WorkerBuffers(max_batch, buffer_names, num_actions)
+    agent = _make_remote_agent(worker_id, buffers, request_queue, response_queue, num_simulations, batch_size,
+                               collect_stats)
+    stats = SearchStats() if collect_stats else None
+
+    positions = 0
+    for game_index in range(num_games):
+        states, policies, outcomes = play_selfplay_game(agent, max_moves, temperature, temperature_moves, stats)
+        path = os.path.join(output_dir, f"game_{worker_id:03d}_{game_index:05d}.npz")
+        np.savez_compressed(path, states=states, policies=policies, outcomes=outcomes)
+        positions += len(states)
+
+    request_queue.put((worker_id, 0))
+    buffers.close()
+    result_queue.put((worker_id, num_games, positions, stats))
+
+
+# Waits for the next message on a result queue of the run
+# Polls every `poll` seconds whether a process has died (crashed server or worker) instead of blocking forever,
+# since the surviving processes would wait on it for good
+
+def _get_result(result_queue, processes, poll=1.0):
+    while True:
+        try:
+            return result_queue.get(timeout=poll)
+        except queue.Empty:
+            failed = [p.name for p in processes if p.exitcode not in (None, 0)]
+            if failed:
+                raise RuntimeError(f"self-play process crashed: {', '.join(failed)}")
+
+
+# Runs the whole pipeline and returns a summary dict (games, positions, games/hour, mean server batch size,
+# and with collect_stats the summed SearchStats of all workers)
+# The policy head size follows the checkpoint: a compact checkpoint runs with a compact head even without `compact`
+# Raises RuntimeError (after stopping the other processes) if the server or a worker crashes
+
+def run_selfplay(num_workers=4, num_games=100, output_dir="selfplay_games", model_path=None, num_simulations=200,
+                 batch_size=8, max_moves=200, temperature=1.0, temperature_moves=30, max_server_batch=256,
+                 max_wait=0.001, server_threads=None, seed=0, inference_backend="script", quantize=False,
+                 compact=False, collect_stats=False):
+    os.makedirs(output_dir, exist_ok=True)
+    ctx = mp.get_context("spawn")
+
+    request_queue = ctx.Queue()
+    response_queues = [ctx.Queue() for _ in range(num_workers)]
+    result_queue = ctx.Queue()
+    stats_queue = ctx.Queue()
+    if model_path and not compact:
+        import torch
+        from aznet import is_compact_state_dict
+
+        compact = is_compact_state_dict(torch.load(model_path))
+    num_actions = NUM_COMPACT_ACTIONS if compact else NUM_ACTIONS
+    buffers = [WorkerBuffers(batch_size, num_actions=num_actions) for _ in range(num_workers)]
+
+    start = time.perf_counter()
+    server = ctx.Process(target=inference_server, name="inference server", args=(
+        model_path, [b.names for b in buffers], batch_size, request_queue, response_queues,
+        max_server_batch, max_wait, server_threads, stats_queue, inference_backend, quantize, compact))
+    processes = [server]
+    try:
+        server.start()
+
+        games_per_worker = [num_games // num_workers + (w < num_games % num_workers) for w in range(num_workers)]
+        for w in range(num_workers):
+            worker = ctx.Process(target=selfplay_worker, name=f"worker {w}", args=(
+                w, buffers[w].names, batch_size, request_queue, response_queues[w], games_per_worker[w], output_dir,
+                num_simulations, batch_size, max_moves, temperature, temperature_moves, seed + w, result_queue,
+                num_actions, collect_stats))
+            worker.start()
+            processes.append(worker)
+
+        results = [_get_result(result_queue, processes) for _ in range(num_workers)]
+        server_stats = _get_result(stats_queue, processes)
+        for process in processes:
+            process.join()
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        for buffer in buffers:
+            buffer.close()
+            buffer.unlink()
+    elapsed = time.perf_counter() - start
+
+    games = sum(r[1] for r in results)
+    positions = sum(r[2] for r in results)
+    summary = {
+        "games": games,
+        "positions": positions,
+        "seconds": elapsed,
+        "games_per_hour": games / elapsed * 3600,
+        "positions_per_second": positions / elapsed,
+        "mean_server_batch": server_stats["evaluated_states"] / max(server_stats["forward_passes"], 1),
+    }
+    if collect_stats:
+        summary["search_stats"] = sum((r[3] for r in results), SearchStats())
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-process Xiangqi self-play with a batched inference server")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--output", default="selfplay_games")
+    parser.add_argument("--model", default=None, help="AZNet checkpoint (random weights if omitted)")
+    parser.add_argument("--simulations", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=8, help="leaves per worker evaluation request")
+    parser.add_argument("--max-moves", type=int, default=200)
+    parser.add_argument("--temperature", type=float, default=1.0)
+    parser.add_argument("--temperature-moves", type=int, default=30)
+    parser.add_argument("--server-batch", type=int, default=256, help="max states per forward pass")
+    parser.add_argument("--max-wait", type=float, default=0.001, help="seconds the server waits to fill a batch")
+    parser.add_argument("--server-threads", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--inference-backend", default="script", choices=["script", "compile", "eager"],
+                        help="how the server builds the model (see aznet.build_inference_model)")
+    parser.add_argument("--quantize", action="store_true", help="dynamic INT8 linear layers (see aznet.quantize_model)")
+    parser.add_argument("--stats", action="store_true", help="collect and print per-phase search statistics")
+    parser.add_argument("--compact", action="store_true",
+                        help="compact policy head (8100-way checkpoints are converted, see aznet.compact_state_dict; "
+                             "compact checkpoints always use it)")
+    args = parser.parse_args()
+
+    summary = run_selfplay(args.workers, args.games, args.output, args.model, args.simulations, args.batch_size,
+                           args.max_moves, args.temperature, args.temperature_moves, args.server_batch,
+                           args.max_wait, args.server_threads, args.seed, args.inference_backend, args.quantize,
+                           args.compact, args.stats)
+    search_stats = summary.pop("search_stats", None)
+    for name, value in summary.items():
+        print(f"{name}: {value:.2f}" if isinstance(value, float) else f"{name}: {value}")
+    if search_stats is not None:
+        print(search_stats.report())
+
+
+if __name__ == "__main__":
+    main()
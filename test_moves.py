@@ -0,0 +1,60 @@
+#EE6892 Reinforcement Learning
+#Chinese Chess (Xiangqi) Move Generation Tests
+
+# Regression tests for the board engine and the move generators
+# The perft reference counts (perft.py) of every reference position up to depth 3, pseudo-legal and legal, and a
+# make_action / unmake_action round trip on random playouts that checks the incremental Zobrist key, king squares
+# and network input planes against a full recomputation
+
+# Usage:
+# python -m pytest -q test_moves.py
+
+import random
+
+import numpy as np
+import pytest
+
+from board import START_FEN, fen_to_position, position_to_state, zobrist_key, is_king_captured
+from moves import get_all_actions
+from perft import REFERENCE_POSITIONS, perft
+
+
+@pytest.mark.parametrize("name, fen, pseudo_legal_counts, legal_counts", REFERENCE_POSITIONS,
+                         ids=[entry[0] for entry in REFERENCE_POSITIONS])
+@pytest.mark.parametrize("legal", [False, True], ids=["pseudo-legal", "legal"])
+def test_perft_reference(name, fen, pseudo_legal_counts, legal_counts, legal):
+    counts = legal_counts if legal else pseudo_legal_counts
+    for depth in (1, 2, 3):
+        assert perft(fen_to_position(fen), depth, legal) == counts[depth], f"{name} depth {depth}"
+
+
+def _snapshot(position):
+    return (bytes(position.squares), position.red_to_move, position.red_king, position.black_king, position.key,
+            position.planes.copy())
+
+
+@pytest.mark.parametrize("fen", [START_FEN] + [entry[1] for entry in REFERENCE_POSITIONS[2:]])
+def test_make_unmake_round_trip(fen):
+    rng = random.Random(6892)
+    for _ in range(20):
+        position = fen_to_position(fen)
+        position.track_planes()
+        history = []
+        for _ in range(60):
+            actions = get_all_actions(position).tolist()
+            if not actions or is_king_captured(position):
+                break
+            action = rng.choice(actions)
+            before = _snapshot(position)
+            captured = position.make_action(action)
+            history.append((action, captured, before))
+
+            assert position.key == zobrist_key(position)
+            assert np.array_equal(position.planes, position_to_state(position))
+
+        # Unwinding the whole game restores every earlier position exactly
+        for action, captured, before in reversed(history):
+            position.unmake_action(action, captured)
+            after = _snapshot(position)
+            assert after[:5] == before[:5]
+            assert np.array_equal(after[5], before[5])
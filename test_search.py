@@ -0,0 +1,124 @@
+#EE6892 Reinforcement Learning
+#Chinese Chess (Xiangqi) Search Tests
+
+# Regression tests for the search budgets of AlphaZero
+# A search limited by time_limit or node_limit alone has no simulation cap, so it must still end when almost every
+# simulation reaches a terminal position (a king capture, or a mate with legal_moves) and no leaf needs the network
+
+# The UCCI engine (engine.py) runs its movetime, time, nodes and infinite searches through those budgets, so it must
+# answer every go command with bestmove, and stop must end an infinite search
+
+# CachedEvaluator shares its cache keys with AlphaZero(cache=...), so both kinds of caching can use one EvaluationCache
+
+# Usage:
+# python -m pytest -q test_search.py
+
+import asyncio
+import time
+
+import numpy as np
+import pytest
+
+from alphazero import AlphaZero
+from board import START_FEN, fen_to_position, position_to_state, is_king_captured
+from engine import Engine, EngineSession, search_budget
+from cache import EvaluationCache, LEGAL_MOVES_KEY
+from evaluators import CachedEvaluator, Evaluator, FakeEvaluator
+from moves import get_legal_actions
+
+
+# Puts most of the prior on a move that wins at once (captures the king or mates), like a trained network would
+class WinningMoveEvaluator(Evaluator):
+    def evaluate(self, positions, legal_actions):
+        priors = []
+        for position, actions in zip(positions, legal_actions):
+            wins = np.zeros(len(actions))
+            for k, action in enumerate(actions.tolist()):
+                captured = position.make_action(action)
+                wins[k] = is_king_captured(position) or not len(get_legal_actions(position))
+                position.unmake_action(action, captured)
+            prior = 0.01 + 100 * wins
+            priors.append(prior / prior.sum())
+        return priors, np.zeros(len(positions), dtype=np.float32)
+
+
+CAPTURE_FEN = "4k4/9/9/9/9/9/9/9/4R4/3K5 w"
+MATE_FEN = "3k5/R8/9/9/9/9/9/9/8R/4K4 w"
+
+
+@pytest.mark.parametrize("fen, options", [
+    (CAPTURE_FEN, {"time_limit": 0.1}),
+    (CAPTURE_FEN, {"node_limit": 500}),
+    (MATE_FEN, {"time_limit": 0.1, "legal_moves": True, "early_stop": True}),
+    (MATE_FEN, {"node_limit": 500, "legal_moves": True, "early_stop": True}),
+    (MATE_FEN, {"node_limit": 500, "legal_moves": True}),
+], ids=["capture-time", "capture-nodes", "mate-time", "mate-nodes-early-stop", "mate-nodes"])
+def test_terminal_searches_end(fen, options):
+    agent = AlphaZero(WinningMoveEvaluator(), num_simulations=None, batch_size=8, **options)
+    start = time.perf_counter()
+    action_probs = agent.get_move_probabilities(position_to_state(fen_to_position(fen)))
+    assert time.perf_counter() - start < 5
+    assert action_probs is not None and np.isclose(action_probs.sum(), 1.0)
+
+
+def test_round_never_exceeds_batch_size():
+    agent = AlphaZero(WinningMoveEvaluator(), num_simulations=None, batch_size=8, node_limit=500, collect_stats=True)
+    agent.get_move_probabilities(position_to_state(fen_to_position(CAPTURE_FEN)))
+    assert agent.last_stats.simulations <= 500 + 8
+
+
+class EngineWinningMoveEvaluator(WinningMoveEvaluator):
+    def close(self):
+        pass
+
+
+def _run_engine(commands, stop_after=None):
+    async def run():
+        engine = Engine(EngineWinningMoveEvaluator(), num_simulations=200, batch_size=8, max_games=1)
+        replies = []
+        session = EngineSession(engine, replies.append)
+        for command in commands:
+            await session.handle(command)
+        if stop_after is not None:
+            await asyncio.sleep(stop_after)
+            await session.handle("stop")
+        if session.search is not None:
+            await asyncio.wait_for(session.search, timeout=5)
+        engine.close()
+        return replies
+
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("go", ["go movetime 100", "go nodes 200", "go time 3000"])
+def test_engine_answers_mate_in_one(go):
+    replies = _run_engine([f"position fen {MATE_FEN}", go])
+    assert replies[-1].startswith("bestmove")
+
+
+def test_engine_stop_ends_infinite_search():
+    replies = _run_engine([f"position fen {MATE_FEN}", "go infinite"], stop_after=0.2)
+    assert replies[-1].startswith("bestmove")
+
+
+def test_engine_nodes_are_simulations():
+    assert search_budget({"nodes": 200.0}, 400) == (200, None, None)
+    replies = _run_engine([f"position fen {START_FEN} moves h2e2", "go nodes 200"])
+    info = [line.split() for line in replies if line.startswith("info time")]
+    assert info and 8 < int(info[-1][info[-1].index("nodes") + 1]) <= 200
+
+
+def test_cached_evaluator_matches_search_cache():
+    state = position_to_state(fen_to_position(START_FEN))
+    cache = EvaluationCache()
+    cached = CachedEvaluator(FakeEvaluator(), cache, legal_moves=True)
+    direct = AlphaZero(FakeEvaluator(), 64, 8, legal_moves=True).get_move_probabilities(state)
+    through_wrapper = AlphaZero(cached, 64, 8, legal_moves=True).get_move_probabilities(state)
+    assert np.array_equal(direct, through_wrapper)
+
+    # The entries use the same keys as a legal-move AlphaZero(cache=...) search, not those of a pseudo-legal one
+    key = fen_to_position(START_FEN).key
+    assert key ^ LEGAL_MOVES_KEY in cache.entries and key not in cache.entries
+    hits = cache.hits
+    AlphaZero(FakeEvaluator(), 64, 8, cache=cache, legal_moves=True).get_move_probabilities(state)
+    assert cache.hits > hits
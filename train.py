@@ -0,0 +1,217 @@
+#EE6892 Reinforcement Learning
+#Chinese Chess (Xiangqi) Training Module
+
+# Streaming trainer for AZNet on self-play data stored with replay.py
+# Minibatches are sampled from the memory-mapped ReplayBuffer by DataLoader worker processes, which also expand the
+# compact positions into 15x10x9 input tensors and build the legal-move masks, so the training loop only runs the model
+# The DataLoader keeps prefetch_factor batches per worker queued in the background
+
+# Loss (AlphaZero):
+# policy: cross-entropy between the MCTS visit distribution and the network policy, where the softmax is taken over
+#         the legal actions of the position only (illegal logits are masked out before the log-softmax)
+# value: mean squared error between the predicted value and the game outcome
+# Optimizer: SGD with momentum and weight decay as in AlphaZero
+# (Adam's first steps move every weight of the large unnormalized heads at once and saturate the tanh value output)
+
+# With compact=True the model has the compact policy head (moves.compact_actions): the stream then hands out policy
+# targets and legal masks over the compact columns only, and an 8100-way init_model is converted on load
+
+# Distillation (see distill.py): with a teacher model the policy target is the teacher's policy (softmax over the legal
+# actions) and the value target is the teacher's value, optionally mixed with the game outcome (outcome_weight)
+
+# Checkpoints are plain AZNet state dicts (loadable with aznet.load_model) written every checkpoint_every steps,
+# next to trainer_state.pth which also holds the optimizer and step so training can be resumed
+
+# Usage:
+# python train.py replay_data --steps 10000 --batch-size 256 --workers 4 --bf16 --checkpoint-dir checkpoints
+
+import argparse
+import os
+import time
+
+import numpy as np
+import torch
+
+from aznet import AZNet, compact_state_dict
+from board import Position
+from moves import NUM_COMPACT_ACTIONS, compact_actions, get_all_actions
+from replay import ReplayBuffer, compact_to_states
+
+
+# Legal action masks (B, 8100) for a batch of compact positions
+def legal_action_masks(positions):
+    masks = np.zeros((len(positions), 8100), dtype=bool)
+    for b, row in enumerate(positions):
+        position = Position(row[:90].astype(np.uint8).tobytes(), bool(row[90]))
+        masks[b, get_all_actions(position)] = True
+    return masks
+
+
+# Infinite stream of training batches drawn from a replay directory
+# Each DataLoader worker opens its own memory maps and random generator, and reopens the buffer every
+# refresh_every batches so that new self-play shards enter the sliding window
+# compact=True keeps only the compact action columns of the policies and masks (for a compact policy head)
+class ReplayStream(torch.utils.data.IterableDataset):
+    def __init__(self, directory, batch_size=256, window_games=None, augment=True, refresh_every=1000, seed=0,
+                 compact=False):
+        super().__init__()
+        self.directory = directory
+        self.batch_size = batch_size
+        self.window_games = window_games
+        self.augment = augment
+        self.refresh_every = refresh_every
+        self.seed = seed
+        self.compact = compact
+
+    def __iter__(self):
+        worker = torch.utils.data.get_worker_info()
+        worker_id = worker.id if worker is not None else 0
+        rng = np.random.default_rng((self.seed, worker_id))
+        buffer = ReplayBuffer(self.directory, self.window_games, self.augment)
+        produced = 0
+        while True:
+            if produced and produced % self.refresh_every == 0:
+                buffer.refresh()
+            positions, policies, outcomes = buffer.sample(self.batch_size, rng)
+            masks = legal_action_masks(positions)
+            if self.compact:
+                policies, masks = policies[:, compact_actions], masks[:, compact_actions]
+            produced += 1
+            yield (torch.from_numpy(compact_to_states(positions)), torch.from_numpy(policies),
+                   torch.from_numpy(outcomes), torch.from_numpy(masks))
+
+
+def alphazero_loss(policy_logits, values, target_policies, target_values, legal_masks):
+    """
+    AlphaZero loss with the policy softmax restricted to legal actions.
+
+    Returns:
+        loss, policy_loss, value_loss (scalar tensors)
+    """
+    policy_logits = policy_logits.float().masked_fill(~legal_masks, float("-inf"))
+    log_probs = torch.log_softmax(policy_logits, dim=1)
+    # Illegal actions have -inf log-probability and zero target, keep them out of the sum
+    policy_loss = -torch.where(target_policies > 0, target_policies * log_probs, torch.zeros_like(log_probs)).sum(1).mean()
+    value_loss = torch.nn.functional.mse_loss(values.float(), target_values)
+    return policy_loss + value_loss, policy_loss, value_loss
+
+
+# Distillation targets for a batch: the teacher's legal-move policy and its value mixed with the game outcome
+# The teacher's logits are brought into the student's policy head layout (the width of legal_masks) first
+def teacher_targets(teacher, states, legal_masks, outcomes, outcome_weight=0.0):
+    with torch.no_grad():
+        logits, values = teacher(states)
+    logits = logits.float()
+    if logits.shape[1] != legal_masks.shape[1]:
+        columns = torch.from_numpy(compact_actions)
+        if legal_masks.shape[1] == NUM_COMPACT_ACTIONS:
+            logits = logits[:, columns]
+        else:
+            full = logits.new_full((len(logits), legal_masks.shape[1]), float("-inf"))
+            logits = full.index_copy_(1, columns, logits)
+    policies = torch.softmax(logits.masked_fill(~legal_masks, float("-inf")), dim=1)
+    values = (1 - outcome_weight) * values.float().reshape(-1) + outcome_weight * outcomes
+    return policies, values
+
+
+def save_checkpoint(model, optimizer, step, checkpoint_dir):
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    torch.save(model.state_dict(), os.path.join(checkpoint_dir, f"aznet_step_{step:07d}.pth"))
+    torch.save({"model": model.state_dict(), "optimizer": optimizer.state_dict(), "step": step},
+               os.path.join(checkpoint_dir, "trainer_state.pth"))
+
+
+def train(replay_dir, steps=10000, batch_size=256, lr=0.01, momentum=0.9, weight_decay=1e-4, num_workers=2,
+          prefetch_factor=4, window_games=None, bf16=False, checkpoint_dir="checkpoints", checkpoint_every=1000, log_every=100,
+          init_model=None, resume=False, seed=0, model=None, compact=False, channels=128, num_blocks=5, teacher=None,
+          outcome_weight=0.0, head_channels=32):
+    torch.manual_seed(seed)
+    if model is None:
+        model = AZNet(compact, channels, num_blocks, head_channels)
+    compact = model.compact
+    if init_model:
+        state_dict = torch.load(init_model)
+        model.load_state_dict(compact_state_dict(state_dict) if compact else state_dict)
+    optimizer = torch.optim.SGD(model.parameters(), lr=lr, momentum=momentum, weight_decay=weight_decay)
+
+    step = 0
+    state_path = os.path.join(checkpoint_dir, "trainer_state.pth")
+    if resume and os.path.exists(state_path):
+        trainer_state = torch.load(state_path)
+        model.load_state_dict(trainer_state["model"])
+        optimizer.load_state_dict(trainer_state["optimizer"])
+        step = trainer_state["step"]
+
+    stream = ReplayStream(replay_dir, batch_size, window_games, seed=seed + step, compact=compact)
+    loader = torch.utils.data.DataLoader(stream, batch_size=None, num_workers=num_workers,
+                                         prefetch_factor=prefetch_factor if num_workers else None,
+                                         persistent_workers=num_workers > 0)
+
+    model.train()
+    window_start = time.perf_counter()
+    window_samples = 0
+    history = []
+    for states, target_policies, target_values, legal_masks in loader:
+        if step >= steps:
+            break
+        if teacher is not None:
+            target_policies, target_values = teacher_targets(teacher, states, legal_masks, target_values,
+                                                             outcome_weight)
+        with torch.autocast("cpu", dtype=torch.bfloat16, enabled=bf16):
+            policy_logits, values = model(states)
+        loss, policy_loss, value_loss = alphazero_loss(policy_logits, values, target_policies, target_values,
+                                                       legal_masks)
+        optimizer.zero_grad(set_to_none=True)
+        loss.backward()
+        optimizer.step()
+        step += 1
+        window_samples += len(states)
+
+        if step % log_every == 0 or step == steps:
+            elapsed = time.perf_counter() - window_start
+            record = {"step": step, "loss": loss.item(), "policy_loss": policy_loss.item(),
+                      "value_loss": value_loss.item(), "samples_per_second": window_samples / elapsed}
+            history.append(record)
+            print(f"step {step}: loss {record['loss']:.4f} (policy {record['policy_loss']:.4f}, "
+                  f"value {record['value_loss']:.4f}), {record['samples_per_second']:.1f} samples/sec")
+            window_start = time.perf_counter()
+            window_samples = 0
+        if step % checkpoint_every == 0 or step == steps:
+            save_checkpoint(model, optimizer, step, checkpoint_dir)
+
+    model.eval()
+    return model, history
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train AZNet on a replay directory of self-play data")
+    parser.add_argument("replay_dir")
+    parser.add_argument("--steps", type=int, default=10000)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--lr", type=float, default=0.01)
+    parser.add_argument("--momentum", type=float, default=0.9)
+    parser.add_argument("--weight-decay", type=float, default=1e-4)
+    parser.add_argument("--workers", type=int, default=2, help="DataLoader worker processes")
+    parser.add_argument("--prefetch", type=int, default=4, help="batches prefetched per worker")
+    parser.add_argument("--window-games", type=int, default=None, help="train on the newest N games only")
+    parser.add_argument("--bf16", action="store_true", help="CPU bfloat16 autocast for the forward pass")
+    parser.add_argument("--checkpoint-dir", default="checkpoints")
+    parser.add_argument("--checkpoint-every", type=int, default=1000)
+    parser.add_argument("--log-every", type=int, default=100)
+    parser.add_argument("--init-model", default=None, help="start from this AZNet checkpoint")
+    parser.add_argument("--resume", action="store_true", help="resume from checkpoint-dir/trainer_state.pth")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--compact", action="store_true", help="train a model with the compact policy head")
+    parser.add_argument("--channels", type=int, default=128, help="AZNet trunk width")
+    parser.add_argument("--blocks", type=int, default=5, help="AZNet residual blocks")
+    parser.add_argument("--head-channels", type=int, default=32, help="AZNet policy head width")
+    args = parser.parse_args()
+
+    train(args.replay_dir, args.steps, args.batch_size, args.lr, args.momentum, args.weight_decay, args.workers, args.prefetch,
+          args.window_games, args.bf16, args.checkpoint_dir, args.checkpoint_every, args.log_every,
+          args.init_model, args.resume, args.seed, compact=args.compact, channels=args.channels,
+          num_blocks=args.blocks, head_channels=args.head_channels)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,23 @@
 # EE6892 Reinforcement Learning 
 # Chinese Chess (Xiangqi) Utils Module
 
-from board import init_board, board_to_state, print_board, state_to_board, is_king_captured, make_move
-from moves import move_to_uci, uci_to_move, get_all_moves
+import numpy as np
+
+# The search works on compact positions and tensor states
+# This module is the UI edge, the only place where positions are turned back into printable list boards
+from board import (init_position, position_to_state, state_to_position, position_to_board,
+                   print_board, is_king_captured, make_move)
+from moves import move_to_uci, uci_to_move, get_all_moves, get_all_actions
 
 # Function to play a game
 def play_game(model, alpha_zero, num_moves=20):
     # Initialize the game
-    board = init_board()
-    state = board_to_state(board, True)  # Red goes first
+    position = init_position()  # Red goes first
+    state = position_to_state(position)
+    alpha_zero.reset()  # Don't carry a search tree over from a previous game
     
     print("Starting a new game of Chinese Chess (Xiangqi)")
-    print_board(board)
+    print_board(position_to_board(position))
     
     move_history = []
     
@@ -33,11 +39,13 @@ def play_game(model, alpha_zero, num_moves=20):
         
         # Apply move
         state = make_move(state, move)
-        board = state_to_board(state)
-        print_board(board)
+        # Re-root the agent's search tree on the played move (ours or the opponent's) so its visits are reused
+        alpha_zero.update_with_move(move)
+        position = state_to_position(state)
+        print_board(position_to_board(position))
         
         # Check for game over
-        if is_king_captured(board):
+        if is_king_captured(position):
             print(f"Game over: {current_player} wins (opponent's king captured)")
             break
     
@@ -45,15 +53,33 @@ def play_game(model, alpha_zero, num_moves=20):
     for i, move in enumerate(move_history):
         print(f"{i+1}. {move}")
 
+# Random positions for testing and benchmarking tools
+# Plays uniformly random moves from the initial position for a random number of plies (up to max_plies)
+# and returns `count` Position objects where the game is not over
+def random_positions(count, seed=0, max_plies=80):
+    rng = np.random.default_rng(seed)
+    positions = []
+    while len(positions) < count:
+        position = init_position()
+        for _ in range(int(rng.integers(0, max_plies + 1))):
+            actions = get_all_actions(position)
+            if not len(actions) or is_king_captured(position):
+                break
+            position.make_action(int(rng.choice(actions)))
+        if not is_king_captured(position) and len(get_all_actions(position)):
+            positions.append(position)
+    return positions
+
 # Simple function to use your model interactively
 def play_interactive(model, alpha_zero):
     # Initialize the game
-    board = init_board()
-    state = board_to_state(board, True)  # Red goes first
+    position = init_position()  # Red goes first
+    state = position_to_state(position)
+    alpha_zero.reset()  # Don't carry a search tree over from a previous game
     
     print("Starting a new interactive game of Chinese Chess (Xiangqi)")
     print("You are playing as Black, AlphaZero is playing as Red")
-    print_board(board)
+    print_board(position_to_board(position))
     
     move_num = 0
     
@@ -78,7 +104,7 @@ def play_interactive(model, alpha_zero):
             
         else:  # Human's turn (Black)
             # Get valid moves
-            valid_moves = get_all_moves(board, False)  # Black's turn
+            valid_moves = get_all_moves(position)  # Black's turn
             valid_uci_moves = [move_to_uci(move) for move in valid_moves]
             
             # Display valid moves
@@ -119,11 +145,13 @@ def play_interactive(model, alpha_zero):
         
         # Apply move
         state = make_move(state, move)
-        board = state_to_board(state)
-        print_board(board)
+        # Re-root the agent's search tree on the played move (ours or the opponent's) so its visits are reused
+        alpha_zero.update_with_move(move)
+        position = state_to_position(state)
+        print_board(position_to_board(position))
         
         # Check for game over
-        if is_king_captured(board):
+        if is_king_captured(position):
             winner = "Black" if current_player == "Black" else "Red"
             print(f"Game over: {winner} wins (opponent's king captured)")
             break
\ No newline at end of file